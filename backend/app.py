@@ -1,10 +1,23 @@
 import os
 from datetime import timedelta, datetime, timezone
-from collections import Counter
+from collections import Counter, defaultdict
 import re
 import requests
 import json
-from flask import Flask, request, jsonify, make_response, redirect
+import base64
+import math
+import threading
+import time
+import hashlib
+import html
+import queue
+import select
+import uuid
+import csv
+import io
+from decimal import Decimal
+from functools import wraps
+from flask import Flask, Response, request, jsonify, make_response, redirect, g, has_app_context
 from flask_cors import CORS
 from flask_jwt_extended import (
     JWTManager, create_access_token, get_jwt, get_jwt_identity,
@@ -15,7 +28,12 @@ from dotenv import load_dotenv, find_dotenv
 import random
 
 from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import sessionmaker
+try:
+    import redis  # optional: shared analytics cache (ANALYTICS_CACHE_REDIS_URL)
+except ImportError:
+    redis = None
 
 # -------------------------
 # Config
@@ -26,6 +44,14 @@ JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "dev-change-me")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 FRONTEND_ORIGIN = os.getenv("FRONTEND_ORIGIN", "http://localhost:5173")
 PORT = int(os.getenv("PORT", "8080"))
+REGISTERED_SET_TTL_SECONDS = float(os.getenv("REGISTERED_SET_TTL_SECONDS", "30"))
+ETAG_MAX_AGE_SECONDS = int(os.getenv("ETAG_MAX_AGE_SECONDS", "300"))
+COUNTER_FOLD_INTERVAL_SECONDS = float(os.getenv("COUNTER_FOLD_INTERVAL_SECONDS", "2"))
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+CHANGE_LOG_RETENTION_HOURS = float(os.getenv("CHANGE_LOG_RETENTION_HOURS", "24"))
+ANALYTICS_CACHE_TTL_SECONDS = float(os.getenv("ANALYTICS_CACHE_TTL_SECONDS", "60"))
+ANALYTICS_CACHE_STALE_SECONDS = float(os.getenv("ANALYTICS_CACHE_STALE_SECONDS", "600"))
+ANALYTICS_CACHE_REDIS_URL = os.getenv("ANALYTICS_CACHE_REDIS_URL")
 
 app = Flask(__name__)
 app.config["JWT_SECRET_KEY"] = JWT_SECRET_KEY
@@ -40,7 +66,8 @@ CORS(
     app,
     resources={r"/*": {"origins": [FRONTEND_ORIGIN]}},
     supports_credentials=True,
-    allow_headers=["Content-Type", "Authorization"],
+    allow_headers=["Content-Type", "Authorization", "If-None-Match", "Idempotency-Key"],
+    expose_headers=["ETag", "Idempotent-Replayed", "X-Analytics-Cache"],
     methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"]
 )
 
@@ -91,8 +118,541 @@ def fetch_user_by_id(db, user_id):
     """), {"id": user_id}).mappings().first()
     return row
 
+# Idempotent DDL (indexes, rollups, triggers, functions) lives in db/migrations/,
+# one file per ensure_*() below; db/schema.sql includes the same files.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "db", "migrations")
+
+def run_migration(name):
+    """Execute db/migrations/<name>.sql in one transaction."""
+    with open(os.path.join(MIGRATIONS_DIR, f"{name}.sql"), encoding="utf-8") as f:
+        sql = f.read()
+    with engine.begin() as conn:
+        conn.execute(text(sql))
+
+def ensure_event_list_indexes():
+    """Indexes backing keyset pagination, filters, facets and the nearby lookup on /api/events
+    (plus the keyset walk of the admin user purge)."""
+    run_migration("event_list_indexes")
+
+def ensure_search_indexes():
+    """Generated tsvector columns plus GIN full-text and trigram indexes for /api/search."""
+    run_migration("search_indexes")
+
+def ensure_event_stats():
+    """Create the trigger-maintained event_stats rollup and backfill missing rows."""
+    run_migration("event_stats")
+
+def ensure_registration_capacity():
+    """Task/session capacity columns and the task waitlist."""
+    run_migration("registration_capacity")
+
+def ensure_counter_deltas():
+    """Delta logs behind registered_count / event_stats and their fold function."""
+    run_migration("counter_deltas")
+
+def fold_counter_deltas():
+    """Fold pending counter deltas into their base rows; returns rows folded into."""
+    with engine.begin() as conn:
+        return conn.execute(text("SELECT fold_counter_deltas()")).scalar() or 0
+
+def _counter_fold_loop():
+    while True:
+        time.sleep(COUNTER_FOLD_INTERVAL_SECONDS)
+        try:
+            fold_counter_deltas()
+        except Exception as e:
+            print(f"Error folding counter deltas: {e}")
+
+def ensure_registration_facts():
+    """Daily registration fact table (+ per-user stats) behind /api/company/*, backfilled once."""
+    run_migration("registration_facts")
+
+def ensure_change_log():
+    """Append-only change feed table backing /api/changes/stream."""
+    run_migration("change_log")
+
+def ensure_change_watermarks():
+    """Per-table change sequences bumped by statement triggers (ETag validators)."""
+    run_migration("change_watermarks")
+
+# -------------------------
+# Per-user registered task/event sets
+# -------------------------
+# user_id -> (expires_at, task_ids, event_ids). Short TTL so other workers'
+# writes show up quickly; writes in this process invalidate immediately.
+_registered_sets_cache: dict[str, tuple[float, frozenset, frozenset]] = {}
+# Bumped on invalidation (per user, or the epoch for everyone) so a load that
+# raced an invalidation doesn't put its pre-write sets back in the cache
+_registered_sets_gen: dict[str, int] = {}
+_registered_sets_epoch = 0
+_registered_sets_lock = threading.Lock()
+
+def load_registered_sets(db, user_id):
+    """Return (task_ids, event_ids) the user is registered for, as sets of str.
+
+    Loaded once per request (memoized on flask.g) and cached per user for
+    REGISTERED_SET_TTL_SECONDS, so list endpoints can set user_registered
+    flags with a set lookup instead of a per-row EXISTS. Writes in other
+    worker processes can't invalidate this cache, so there the sets may lag
+    by up to the TTL.
+    """
+    uid = str(user_id)
+    memo = g.setdefault("registered_sets", {})
+    if uid in memo:
+        return memo[uid]
+    now = time.monotonic()
+    with _registered_sets_lock:
+        hit = _registered_sets_cache.get(uid)
+        gen = (_registered_sets_epoch, _registered_sets_gen.get(uid, 0))
+    if hit and hit[0] > now:
+        memo[uid] = (hit[1], hit[2])
+        return memo[uid]
+
+    rows = db.execute(text("""
+        SELECT utr.task_id, et.event_id
+        FROM user_task_registration utr
+        JOIN event_task et ON et.id = utr.task_id
+        WHERE utr.user_id = :uid
+    """), {"uid": uid}).all()
+    task_ids = frozenset(str(r[0]) for r in rows)
+    event_ids = frozenset(str(r[1]) for r in rows)
+    with _registered_sets_lock:
+        if len(_registered_sets_cache) > 10_000:
+            for k in [k for k, v in _registered_sets_cache.items() if v[0] <= now]:
+                del _registered_sets_cache[k]
+        if gen == (_registered_sets_epoch, _registered_sets_gen.get(uid, 0)):
+            _registered_sets_cache[uid] = (now + REGISTERED_SET_TTL_SECONDS, task_ids, event_ids)
+    memo[uid] = (task_ids, event_ids)
+    return memo[uid]
+
+def invalidate_registered_sets(*user_ids):
+    """Drop cached sets for the given users, or for everyone when called with none."""
+    global _registered_sets_epoch
+    with _registered_sets_lock:
+        if not user_ids:
+            _registered_sets_epoch += 1
+            _registered_sets_cache.clear()
+        for uid in user_ids:
+            uid = str(uid)
+            _registered_sets_gen[uid] = _registered_sets_gen.get(uid, 0) + 1
+            _registered_sets_cache.pop(uid, None)
+    memo = g.get("registered_sets") if has_app_context() else None
+    if memo is not None:
+        if not user_ids:
+            memo.clear()
+        for uid in user_ids:
+            memo.pop(str(uid), None)
+
+def mark_registered(rows, ids, key="id", flag="user_registered"):
+    """Copy rows to dicts and set flag = (row[key] in ids)."""
+    out = []
+    for r in rows:
+        d = dict(r)
+        d[flag] = str(d[key]) in ids
+        out.append(d)
+    return out
+
+# -------------------------
+# Conditional GET (ETag) helpers
+# -------------------------
+# Logical source -> change sequence maintained by ensure_change_watermarks()
+CHANGE_SEQUENCES: dict[str, str] = {
+    "event": "change_seq_event",
+    "event_task": "change_seq_event_task",
+    "registration": "change_seq_registration",
+    "app_user": "change_seq_app_user",
+    "directory": "change_seq_directory",
+}
+
+def read_watermarks(db, sources):
+    """Current change-sequence values for the given sources (one cheap query)."""
+    cols = ", ".join(f"(SELECT last_value FROM {CHANGE_SEQUENCES[src]})" for src in sources)
+    return tuple(db.execute(text(f"SELECT {cols}")).first())
+
+def conditional_get(*sources):
+    """Answer 304 when none of `sources` changed since the client's ETag.
+
+    The ETag covers the caller, the full path + query string and the
+    watermarks, so the heavy view only runs when something it reads moved.
+    Sequence bumps are not transactional and can be seen just before their
+    commit, so the ETag also rolls over every ETAG_MAX_AGE_SECONDS to bound
+    how long such a validator could pin a stale body. A body that
+    @analytics_cache served stale gets no ETag, since it predates these
+    watermarks.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with SessionLocal() as db:
+                marks = read_watermarks(db, sources)
+            g.watermarks = dict(zip(sources, marks))
+            bucket = int(time.time() // max(ETAG_MAX_AGE_SECONDS, 1))
+            raw = f"{get_jwt_identity()}|{request.full_path}|{marks}|{bucket}"
+            etag = hashlib.sha1(raw.encode()).hexdigest()
+            if etag in request.if_none_match:
+                resp = make_response("", 304)
+                resp.set_etag(etag)
+                return resp
+            resp = make_response(fn(*args, **kwargs))
+            if resp.status_code == 200 and resp.headers.get("X-Analytics-Cache") != "stale":
+                resp.set_etag(etag)
+                resp.headers["Cache-Control"] = "private, no-cache"
+            return resp
+        return wrapper
+    return decorator
+
+# -------------------------
+# Analytics result cache
+# -------------------------
+# Entries are {"value", "version", "fresh_until", "stale_until"} (wall-clock
+# times so they mean the same thing in every worker sharing a Redis backend).
+# "version" is the change-sequence watermarks of the sources the view reads,
+# so registration/task writes (and the counter fold) invalidate dependants.
+ANALYTICS_CACHE_WAIT_SECONDS = 10  # also the refresh lock lifetime in Redis
+
+class _LocalAnalyticsCache:
+    def __init__(self):
+        self._entries: dict[str, dict] = {}
+        self._refreshing: set[str] = set()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def set(self, key, entry):
+        with self._lock:
+            if len(self._entries) > 10_000:
+                now = time.time()
+                for k in [k for k, v in self._entries.items() if v["stale_until"] <= now]:
+                    del self._entries[k]
+            self._entries[key] = entry
+
+    def try_lock(self, key):
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def unlock(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+class _RedisAnalyticsCache:
+    # Delete the lock only if it still holds our token: after the PX expiry
+    # another worker may own it, and a plain DEL would release theirs
+    _UNLOCK_SCRIPT = """
+    if redis.call('get', KEYS[1]) == ARGV[1] then
+      return redis.call('del', KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url):
+        self._redis = redis.Redis.from_url(url)
+        self._unlock = self._redis.register_script(self._UNLOCK_SCRIPT)
+        self._tokens: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        raw = self._redis.get(f"analytics:{key}")
+        return json.loads(raw) if raw else None
+
+    def set(self, key, entry):
+        ttl = max(int(entry["stale_until"] - time.time()) + 1, 1)
+        self._redis.set(f"analytics:{key}", json.dumps(entry, default=str), ex=ttl)
+
+    def try_lock(self, key):
+        token = uuid.uuid4().hex
+        if not self._redis.set(f"analytics-lock:{key}", token, nx=True, px=int(ANALYTICS_CACHE_WAIT_SECONDS * 1000)):
+            return False
+        with self._lock:
+            self._tokens[key] = token
+        return True
+
+    def unlock(self, key):
+        with self._lock:
+            token = self._tokens.pop(key, None)
+        if token is not None:
+            self._unlock(keys=[f"analytics-lock:{key}"], args=[token])
+
+def _make_analytics_cache():
+    if ANALYTICS_CACHE_REDIS_URL:
+        if redis is not None:
+            return _RedisAnalyticsCache(ANALYTICS_CACHE_REDIS_URL)
+        print("ANALYTICS_CACHE_REDIS_URL is set but the redis package is not installed; using the in-process cache")
+    return _LocalAnalyticsCache()
+
+_analytics_cache = _make_analytics_cache()
+
+def analytics_cache(*sources, ttl=None, per_user=False):
+    """Serve a 200 JSON view from the analytics cache.
+
+    A hit is fresh while it is younger than `ttl` (ANALYTICS_CACHE_TTL_SECONDS
+    by default) and the watermarks of `sources` have not moved. Otherwise one
+    request per key (a lock in the backend) recomputes while everyone else is
+    answered with the old entry for up to ANALYTICS_CACHE_STALE_SECONDS; only
+    when there is nothing to serve do they wait for that refresh. Put it under
+    @conditional_get with the same sources so the watermarks are read once.
+    `per_user` keys entries by caller for views that depend on who asks.
+    """
+    ttl = ANALYTICS_CACHE_TTL_SECONDS if ttl is None else ttl
+
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if ttl <= 0 or ANALYTICS_CACHE_TTL_SECONDS <= 0:
+                return fn(*args, **kwargs)
+            key = f"{fn.__name__}|{get_jwt_identity() if per_user else ''}|{request.full_path}"
+            marks = g.get("watermarks") or {}
+            if not all(src in marks for src in sources):
+                with SessionLocal() as db:
+                    marks = dict(zip(sources, read_watermarks(db, sources)))
+            version = ",".join(str(marks[src]) for src in sources)
+
+            def respond(value, state):
+                resp = make_response(jsonify(value), 200)
+                resp.headers["X-Analytics-Cache"] = state
+                return resp
+
+            try:
+                entry = _analytics_cache.get(key)
+                if entry and entry["version"] == version and entry["fresh_until"] > time.time():
+                    return respond(entry["value"], "hit")
+                locked = _analytics_cache.try_lock(key)
+            except Exception as e:
+                print(f"Error reading analytics cache: {e}")
+                return fn(*args, **kwargs)
+
+            if not locked:
+                if entry and entry["stale_until"] > time.time():
+                    return respond(entry["value"], "stale")
+                # nothing servable yet: wait for the refresher instead of piling on
+                deadline = time.monotonic() + ANALYTICS_CACHE_WAIT_SECONDS
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    try:
+                        entry = _analytics_cache.get(key)
+                    except Exception:
+                        break
+                    if entry and entry["version"] == version:
+                        return respond(entry["value"], "hit")
+                return fn(*args, **kwargs)
+
+            try:
+                result = fn(*args, **kwargs)
+                value, status = result if isinstance(result, tuple) else (result, 200)
+                if status != 200 or not isinstance(value, dict):
+                    return result
+                now = time.time()
+                try:
+                    _analytics_cache.set(key, {
+                        "value": value,
+                        "version": version,
+                        "fresh_until": now + ttl,
+                        "stale_until": now + ttl + ANALYTICS_CACHE_STALE_SECONDS,
+                    })
+                except Exception as e:
+                    print(f"Error writing analytics cache: {e}")
+                return respond(value, "miss")
+            finally:
+                try:
+                    _analytics_cache.unlock(key)
+                except Exception as e:
+                    print(f"Error releasing analytics cache lock: {e}")
+        return wrapper
+    return decorator
+
+# -------------------------
+# Idempotency keys for write endpoints
+# -------------------------
+# (user_id, key) -> (expires_at, fingerprint, stored response or None while in flight)
+_idempotency_store: dict[tuple[str, str], tuple[float, str, tuple | None]] = {}
+_idempotency_lock = threading.Lock()
+_idempotency_next_sweep = 0.0
+
+def idempotent(fn):
+    """Replay the first response for a repeated `Idempotency-Key` header.
+
+    Keyed by caller + key for IDEMPOTENCY_TTL_SECONDS. A retry of a finished
+    request is answered from memory without touching the DB or Gemini; a
+    retry while the first attempt is still running gets 409, and reusing a
+    key for a different method/path/body gets 422. 5xx responses and
+    exceptions are not stored, so those can be retried for real. Requests
+    without the header are unaffected.
+
+    The store is per process: a retry routed to another worker runs again.
+    Deploy the backend as a single worker process (threads are fine), or
+    route a client's requests to the same worker, where replay is relied on.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        key = request.headers.get("Idempotency-Key", "").strip()
+        if not key:
+            return fn(*args, **kwargs)
+        if len(key) > 255:
+            return jsonify({"error": "Idempotency-Key too long"}), 400
+        slot = (str(get_jwt_identity()), key)
+        fingerprint = hashlib.sha1(
+            f"{request.method} {request.full_path}".encode() + b"\0" + request.get_data()
+        ).hexdigest()
+        now = time.monotonic()
+        with _idempotency_lock:
+            hit = _idempotency_store.get(slot)
+            if hit and hit[0] <= now:
+                hit = None
+            if hit is None:
+                _idempotency_store[slot] = (now + IDEMPOTENCY_TTL_SECONDS, fingerprint, None)
+        if hit is not None:
+            _, seen_fingerprint, stored = hit
+            if seen_fingerprint != fingerprint:
+                return jsonify({"error": "Idempotency-Key was used for a different request"}), 422
+            if stored is None:
+                return jsonify({"error": "A request with this Idempotency-Key is in progress"}), 409
+            status, body, mimetype = stored
+            resp = Response(body, status=status, mimetype=mimetype)
+            resp.headers["Idempotent-Replayed"] = "true"
+            return resp
+
+        try:
+            resp = make_response(fn(*args, **kwargs))
+        except Exception:
+            with _idempotency_lock:
+                _idempotency_store.pop(slot, None)
+            raise
+        with _idempotency_lock:
+            if resp.status_code >= 500 or resp.is_streamed:
+                _idempotency_store.pop(slot, None)
+            else:
+                _idempotency_store[slot] = (
+                    time.monotonic() + IDEMPOTENCY_TTL_SECONDS, fingerprint,
+                    (resp.status_code, resp.get_data(), resp.mimetype),
+                )
+            # drop expired entries (at most once a minute) so the store stays bounded by the TTL
+            global _idempotency_next_sweep
+            now = time.monotonic()
+            if now >= _idempotency_next_sweep:
+                _idempotency_next_sweep = now + 60
+                for k in [k for k, v in _idempotency_store.items() if v[0] <= now]:
+                    del _idempotency_store[k]
+        return resp
+    return wrapper
+
+# -------------------------
+# Change feed (change_log + LISTEN/NOTIFY fan-out for SSE)
+# -------------------------
+CHANGE_FEED_CHANNEL = "change_feed"
+CHANGE_FEED_REPLAY_LIMIT = 1000
+
+def log_change(db, kind, task_ids, user_id=None, payload=None):
+    """Append change_log rows for `task_ids` and NOTIFY them, in the caller's
+    transaction: nothing is announced unless the write commits."""
+    task_ids = [str(t) for t in task_ids]
+    if not task_ids:
+        return
+    db.execute(text(f"""
+        WITH c AS (
+          INSERT INTO change_log (kind, event_id, task_id, user_id, payload)
+          SELECT :kind, et.event_id, et.id, CAST(:uid AS uuid), CAST(:payload AS jsonb)
+          FROM event_task et
+          WHERE et.id = ANY(CAST(:tids AS uuid[]))
+          RETURNING id, kind, event_id, task_id, user_id, payload, created_at
+        )
+        SELECT pg_notify('{CHANGE_FEED_CHANNEL}', row_to_json(c)::text) FROM c
+    """), {"kind": kind, "uid": str(user_id) if user_id else None,
+           "payload": json.dumps(payload or {}), "tids": task_ids})
+
+# One LISTEN connection per process fans notifications out to per-client queues
+_feed_subscribers: set[queue.Queue] = set()
+_feed_lock = threading.Lock()
+_feed_thread: threading.Thread | None = None
+
+def _feed_publish(msg):
+    with _feed_lock:
+        subscribers = list(_feed_subscribers)
+    for q in subscribers:
+        try:
+            q.put_nowait(msg)
+        except queue.Full:
+            # slow client: drop it; it reconnects with Last-Event-ID and replays
+            with _feed_lock:
+                _feed_subscribers.discard(q)
+
+def _feed_listen_loop():
+    last_id = None
+    while True:
+        raw = None
+        try:
+            raw = engine.raw_connection()
+            conn = raw.driver_connection
+            conn.autocommit = True
+            cur = conn.cursor()
+            cur.execute(f"LISTEN {CHANGE_FEED_CHANNEL}")
+            if last_id is not None:
+                # catch up on anything committed while we were reconnecting
+                cur.execute("SELECT row_to_json(c)::text FROM change_log c WHERE id > %s ORDER BY id", (last_id,))
+                for (payload,) in cur.fetchall():
+                    msg = json.loads(payload)
+                    last_id = max(last_id, msg["id"])
+                    _feed_publish(msg)
+            while True:
+                if select.select([conn], [], [], 30) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    msg = json.loads(conn.notifies.pop(0).payload)
+                    last_id = msg["id"] if last_id is None else max(last_id, msg["id"])
+                    _feed_publish(msg)
+        except Exception as e:
+            print(f"Change feed listener error: {e}")
+            time.sleep(1)
+        finally:
+            if raw is not None:
+                raw.invalidate()
+
+CHANGE_LOG_PRUNE_INTERVAL_SECONDS = 600
+
+def _change_log_prune_loop():
+    # Runs in every process from startup, whether or not anyone is streaming
+    while True:
+        try:
+            with engine.begin() as conn:
+                conn.execute(
+                    text("DELETE FROM change_log WHERE created_at < now() - make_interval(secs => :secs)"),
+                    {"secs": CHANGE_LOG_RETENTION_HOURS * 3600},
+                )
+        except Exception as e:
+            print(f"Error pruning change log: {e}")
+        time.sleep(CHANGE_LOG_PRUNE_INTERVAL_SECONDS)
+
+def subscribe_changes():
+    global _feed_thread
+    q = queue.Queue(maxsize=1000)
+    with _feed_lock:
+        _feed_subscribers.add(q)
+        if _feed_thread is None:
+            _feed_thread = threading.Thread(target=_feed_listen_loop, name="change-feed", daemon=True)
+            _feed_thread.start()
+    return q
+
+def unsubscribe_changes(q):
+    with _feed_lock:
+        _feed_subscribers.discard(q)
+
 # Run once at startup
 ensure_password_column()
+ensure_event_list_indexes()
+ensure_event_stats()
+ensure_search_indexes()
+ensure_change_watermarks()
+ensure_registration_capacity()
+ensure_counter_deltas()
+ensure_registration_facts()
+ensure_change_log()
+if COUNTER_FOLD_INTERVAL_SECONDS > 0:
+    threading.Thread(target=_counter_fold_loop, name="counter-fold", daemon=True).start()
+threading.Thread(target=_change_log_prune_loop, name="change-log-prune", daemon=True).start()
 
 # -------------------------
 # Skill vocabulary (50 common skills)
@@ -185,6 +745,57 @@ def _require_fields(d, required):
         return f"missing fields: {', '.join(missing)}"
     return None
 
+def _parse_limit(v, default=50, maximum=200):
+    # Clamp page sizes so a single request can't pull the whole table
+    try:
+        n = int(v) if v not in (None, "") else default
+    except (TypeError, ValueError):
+        raise ValueError("limit must be an integer")
+    return max(1, min(n, maximum))
+
+def _parse_bool(v):
+    if v is None or v == "":
+        return None
+    s = str(v).strip().lower()
+    if s in ("true", "1", "yes"):
+        return True
+    if s in ("false", "0", "no"):
+        return False
+    raise ValueError(f"invalid boolean: {v}")
+
+EARTH_RADIUS_KM = 6371.0088
+
+def _bounding_box(lat, lng, radius_km):
+    """Lat/lng box that contains every point within radius_km of (lat, lng).
+
+    Returns (min_lat, max_lat, min_lng, max_lng); the lng bounds are None when
+    the box covers a pole, and min_lng > max_lng when it wraps the antimeridian.
+    """
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat, max_lat = lat - dlat, lat + dlat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90.0), min(max_lat, 90.0), None, None
+    dlng = math.degrees(math.asin(min(1.0, math.sin(radius_km / EARTH_RADIUS_KM) / math.cos(math.radians(lat)))))
+    min_lng, max_lng = lng - dlng, lng + dlng
+    if min_lng < -180:
+        min_lng += 360
+    if max_lng > 180:
+        max_lng -= 360
+    return min_lat, max_lat, min_lng, max_lng
+
+def _encode_cursor(created_at, row_id):
+    # Opaque keyset cursor over (created_at, id)
+    raw = json.dumps({"ts": created_at.isoformat(), "id": str(row_id)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def _decode_cursor(s):
+    try:
+        pad = "=" * (-len(s) % 4)
+        obj = json.loads(base64.urlsafe_b64decode(s + pad).decode())
+        return _parse_ts(obj["ts"]), str(obj["id"])
+    except Exception:
+        raise ValueError("invalid cursor")
+
 # -------------------------
 # Routes
 # -------------------------
@@ -421,6 +1032,7 @@ def list_organizations():
 
 @app.post("/api/organizations")
 @jwt_required()
+@idempotent
 def create_organization():
     """Create a new organization for testing"""
     data = request.get_json(silent=True) or {}
@@ -443,6 +1055,7 @@ def create_organization():
 # -------------------------
 @app.post("/api/events")
 @jwt_required()
+@idempotent
 def create_event():
     """
     Body JSON (minimal):
@@ -906,46 +1519,352 @@ def call_gemini_rank_tasks(user_skills: list[str], tasks: list[dict]) -> list[st
 # -------------------------
 @app.get("/api/events")
 @jwt_required()
+@conditional_get("event", "event_task", "registration")
 def list_events():
+    """Keyset-paginated event listing, newest first.
+
+    Query params (all optional):
+      limit=50 (max 200), cursor=<next_cursor from previous page>,
+      mode=in_person,virtual, remote=true|false, city=..., state=...,
+      date_from=ISO, date_to=ISO (events whose task time span overlaps the window)
+    """
     user_id = get_jwt_identity()
+    args = request.args
+    try:
+        limit = _parse_limit(args.get("limit"))
+        remote = _parse_bool(args.get("remote"))
+        cursor = _decode_cursor(args["cursor"]) if args.get("cursor") else None
+        date_from = _parse_ts(args["date_from"]) if args.get("date_from") else None
+        date_to = _parse_ts(args["date_to"]) if args.get("date_to") else None
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    modes = [m.lower() for m in _as_list(args.get("mode"))]
+    bad = [m for m in modes if m not in VALID_EVENT_MODES]
+    if bad:
+        return jsonify({"error": f"mode must be one of {sorted(VALID_EVENT_MODES)}"}), 400
+
+    where = ["TRUE"]
+    params = {"limit": limit + 1}
+    if cursor:
+        where.append("(e.created_at, e.id) < (:cursor_ts, CAST(:cursor_id AS uuid))")
+        params["cursor_ts"], params["cursor_id"] = cursor
+    if modes:
+        where.append("e.mode = ANY(CAST(:modes AS event_mode[]))")
+        params["modes"] = modes
+    if remote is not None:
+        where.append("COALESCE(e.is_remote, FALSE) = :remote")
+        params["remote"] = remote
+    if args.get("city"):
+        where.append("lower(e.location_city) = lower(:city)")
+        params["city"] = args["city"].strip()
+    if args.get("state"):
+        where.append("upper(e.location_state) = upper(:state)")
+        params["state"] = args["state"].strip()
+    if date_from:
+        where.append("s.end_ts >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        where.append("s.start_ts < :date_to")
+        params["date_to"] = date_to
+
     with SessionLocal() as db:
-        rows = db.execute(text("""
+        # Filter + page first; aggregates come from the event_stats rollup
+        rows = db.execute(text(f"""
             SELECT 
               e.id, e.organization_id, e.title, e.description, e.mode,
               e.location_city, e.location_state, e.is_remote, e.causes,
               e.skills_needed, e.tags, e.min_duration_min, e.rsvp_url, e.contact_email,
               e.created_at, e.updated_at,
-              (
-                SELECT COALESCE(COUNT(DISTINCT utr.user_id), 0)
-                FROM user_task_registration utr
-                JOIN event_task et ON et.id = utr.task_id
-                WHERE et.event_id = e.id
-              ) AS total_registered_count,
-              (SELECT MIN(start_ts) FROM event_task et WHERE et.event_id = e.id) AS event_start_ts,
-              (SELECT MAX(end_ts)   FROM event_task et WHERE et.event_id = e.id) AS event_end_ts,
-              COALESCE((
-                SELECT ARRAY(
-                  SELECT DISTINCT s
-                  FROM event_task et, unnest(et.skills_required) AS s
-                  WHERE et.event_id = e.id AND s IS NOT NULL
-                )
-              ), ARRAY[]::TEXT[]) AS event_skills,
-              EXISTS (
-                SELECT 1
-                FROM user_task_registration utr
-                JOIN event_task et2 ON et2.id = utr.task_id
-                WHERE utr.user_id = :uid AND et2.event_id = e.id
-              ) AS user_registered
-            FROM event e
-            ORDER BY e.created_at DESC
-        """), {"uid": user_id}).mappings().all()
-    return jsonify({"events": [dict(r) for r in rows]}), 200
+              COALESCE(live_registrant_count(s), 0) AS total_registered_count,
+              s.start_ts AS event_start_ts,
+              s.end_ts AS event_end_ts,
+              COALESCE(s.skills, ARRAY[]::TEXT[]) AS event_skills
+            FROM (
+              SELECT e.*
+              FROM event e
+              LEFT JOIN event_stats s ON s.event_id = e.id
+              WHERE {" AND ".join(where)}
+              ORDER BY e.created_at DESC, e.id DESC
+              LIMIT :limit
+            ) e
+            LEFT JOIN event_stats s ON s.event_id = e.id
+            ORDER BY e.created_at DESC, e.id DESC
+        """), params).mappings().all()
+        _, my_events = load_registered_sets(db, user_id)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_cursor(rows[-1]["created_at"], rows[-1]["id"])
+    return jsonify({"events": mark_registered(rows, my_events), "next_cursor": next_cursor}), 200
+
+@app.get("/api/events/nearby")
+@jwt_required()
+@conditional_get("event", "event_task", "registration")
+def list_nearby_events():
+    """Events within radius_km of a point, nearest first.
+
+    Query params: lat, lng (required), radius_km=25 (max 500), limit=20 (max 100),
+    mode=in_person,hybrid, cause=education,health (matches any).
+    An indexed lat/lng bounding box narrows candidates before the exact
+    haversine distance is computed and filtered.
+    """
+    args = request.args
+    try:
+        lat = float(args["lat"])
+        lng = float(args["lng"])
+        radius_km = float(args.get("radius_km") or 25)
+        limit = _parse_limit(args.get("limit"), default=20, maximum=100)
+    except KeyError:
+        return jsonify({"error": "lat and lng are required"}), 400
+    except ValueError:
+        return jsonify({"error": "lat, lng, radius_km and limit must be numeric"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return jsonify({"error": "lat/lng out of range"}), 400
+    if not (0 < radius_km <= 500):
+        return jsonify({"error": "radius_km must be in (0, 500]"}), 400
+
+    modes = [m.lower() for m in _as_list(args.get("mode"))]
+    if any(m not in VALID_EVENT_MODES for m in modes):
+        return jsonify({"error": f"mode must be one of {sorted(VALID_EVENT_MODES)}"}), 400
+    causes = _as_list(args.get("cause"))
+
+    min_lat, max_lat, min_lng, max_lng = _bounding_box(lat, lng, radius_km)
+    where = ["e.location_lat BETWEEN :min_lat AND :max_lat", "e.location_lng IS NOT NULL"]
+    params = {
+        "lat": lat, "lng": lng, "radius_km": radius_km,
+        "limit": limit, "min_lat": min_lat, "max_lat": max_lat, "r": EARTH_RADIUS_KM,
+    }
+    if min_lng is not None:
+        params["min_lng"], params["max_lng"] = min_lng, max_lng
+        if min_lng <= max_lng:
+            where.append("e.location_lng BETWEEN :min_lng AND :max_lng")
+        else:
+            where.append("(e.location_lng >= :min_lng OR e.location_lng <= :max_lng)")
+    if modes:
+        where.append("e.mode = ANY(CAST(:modes AS event_mode[]))")
+        params["modes"] = modes
+    if causes:
+        where.append("e.causes && CAST(:causes AS TEXT[])")
+        params["causes"] = causes
+
+    with SessionLocal() as db:
+        rows = db.execute(text(f"""
+            SELECT
+              e.id, e.organization_id, e.title, e.description, e.mode,
+              e.location_city, e.location_state, e.location_lat, e.location_lng,
+              e.is_remote, e.causes, e.skills_needed, e.tags, e.min_duration_min,
+              e.rsvp_url, e.contact_email, e.created_at, e.updated_at,
+              ROUND(CAST(e.distance_km AS numeric), 2)::float AS distance_km,
+              COALESCE(live_registrant_count(s), 0) AS total_registered_count,
+              s.start_ts AS event_start_ts,
+              s.end_ts AS event_end_ts,
+              COALESCE(s.skills, ARRAY[]::TEXT[]) AS event_skills
+            FROM (
+              SELECT e.*,
+                     2 * :r * asin(LEAST(1.0, sqrt(
+                       power(sin(radians(e.location_lat - :lat) / 2), 2) +
+                       cos(radians(:lat)) * cos(radians(e.location_lat)) *
+                       power(sin(radians(e.location_lng - :lng) / 2), 2)
+                     ))) AS distance_km
+              FROM event e
+              WHERE {" AND ".join(where)}
+            ) e
+            LEFT JOIN event_stats s ON s.event_id = e.id
+            WHERE e.distance_km <= :radius_km
+            ORDER BY e.distance_km, e.id
+            LIMIT :limit
+        """), params).mappings().all()
+        _, my_events = load_registered_sets(db, get_jwt_identity())
+    return jsonify({"events": mark_registered(rows, my_events)}), 200
+
+# Facet name -> event array column
+EVENT_FACETS: dict[str, str] = {
+    "causes": "causes",
+    "skills": "skills_needed",
+    "tags": "tags",
+    "accessibility": "accessibility",
+}
+
+@app.get("/api/events/browse")
+@jwt_required()
+@conditional_get("event", "event_task", "registration")
+def browse_events():
+    """Faceted event browse: one page of matches plus facet value counts.
+
+    Query params: causes, skills, tags, accessibility (comma-separated; an
+    event must contain all given values), limit=20 (max 100), offset=0.
+    Filters use the GIN array indexes; facet counts come from a single
+    unnest aggregation over the matching set, in the same statement.
+    """
+    try:
+        limit = _parse_limit(request.args.get("limit"), default=20, maximum=100)
+        offset = max(0, int(request.args.get("offset") or 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+
+    where = ["TRUE"]
+    params = {"limit": limit, "offset": offset}
+    selected = {}
+    for facet, column in EVENT_FACETS.items():
+        values = _as_list(request.args.get(facet))
+        if values:
+            where.append(f"e.{column} @> CAST(:f_{facet} AS TEXT[])")
+            params[f"f_{facet}"] = values
+            selected[facet] = values
+
+    with SessionLocal() as db:
+        row = db.execute(text(f"""
+            WITH matched AS MATERIALIZED (
+              SELECT e.id, e.created_at, e.causes, e.skills_needed, e.tags, e.accessibility
+              FROM event e
+              WHERE {" AND ".join(where)}
+            ),
+            page AS (
+              SELECT
+                e.id, e.organization_id, e.title, e.description, e.mode,
+                e.location_city, e.location_state, e.is_remote, e.causes,
+                e.skills_needed, e.accessibility, e.tags, e.min_duration_min,
+                e.rsvp_url, e.contact_email, e.created_at, e.updated_at,
+                COALESCE(live_registrant_count(s), 0) AS total_registered_count,
+                s.start_ts AS event_start_ts,
+                s.end_ts AS event_end_ts,
+                COALESCE(s.skills, ARRAY[]::TEXT[]) AS event_skills
+              FROM (
+                SELECT id FROM matched
+                ORDER BY created_at DESC, id DESC
+                LIMIT :limit OFFSET :offset
+              ) m
+              JOIN event e ON e.id = m.id
+              LEFT JOIN event_stats s ON s.event_id = e.id
+            ),
+            facet_counts AS (
+              SELECT f.facet, v.value, COUNT(*) AS n
+              FROM matched m
+              CROSS JOIN LATERAL (VALUES
+                ('causes', m.causes), ('skills', m.skills_needed),
+                ('tags', m.tags), ('accessibility', m.accessibility)
+              ) AS f(facet, vals)
+              CROSS JOIN LATERAL unnest(f.vals) AS v(value)
+              WHERE v.value IS NOT NULL AND v.value <> ''
+              GROUP BY f.facet, v.value
+            )
+            SELECT
+              (SELECT COUNT(*) FROM matched) AS total,
+              (SELECT COALESCE(json_agg(p ORDER BY p.created_at DESC, p.id DESC), '[]'::json)
+                 FROM page p) AS events,
+              (SELECT COALESCE(json_agg(json_build_object('facet', facet, 'value', value, 'count', n)
+                                        ORDER BY facet, n DESC, value), '[]'::json)
+                 FROM facet_counts) AS facets
+        """), params).mappings().first()
+        _, my_events = load_registered_sets(db, get_jwt_identity())
+
+    facets = {name: [] for name in EVENT_FACETS}
+    for f in row["facets"]:
+        facets[f["facet"]].append({"value": f["value"], "count": f["count"]})
+    total = int(row["total"] or 0)
+    return jsonify({
+        "events": mark_registered(row["events"], my_events),
+        "facets": facets,
+        "selected": selected,
+        "total": total,
+        "next_offset": offset + limit if offset + limit < total else None,
+    }), 200
+
+# -------------------------
+# Search (events + tasks)
+# -------------------------
+SEARCH_KINDS = {"all", "events", "tasks"}
+MAX_SEARCH_OFFSET = 1000
+# ts_headline doesn't escape the text it highlights, so it marks matches with
+# private-use characters and the result is HTML-escaped before they become <mark>
+SEARCH_MARK_START, SEARCH_MARK_STOP = "\ue000", "\ue001"
+
+def _highlight_html(value):
+    escaped = html.escape(value or "")
+    return escaped.replace(SEARCH_MARK_START, "<mark>").replace(SEARCH_MARK_STOP, "</mark>")
+
+@app.get("/api/search")
+@jwt_required()
+@conditional_get("event", "event_task")
+def search():
+    """Ranked full-text search over event and event_task title/description.
+
+    Query params: q (required), type=all|events|tasks, limit=20 (max 100),
+    offset=0 (max 1000; next_offset is null past that depth).
+    Matches either the weighted tsvector (title > description) or a trigram
+    match on the title, so typos still hit. Both paths are GIN-indexed; the
+    ts_headline highlighting only runs for rows on the returned page.
+    """
+    q = (request.args.get("q") or "").strip()
+    kind = (request.args.get("type") or "all").strip().lower()
+    if len(q) < 2:
+        return jsonify({"error": "q must be at least 2 characters"}), 400
+    if kind not in SEARCH_KINDS:
+        return jsonify({"error": f"type must be one of {sorted(SEARCH_KINDS)}"}), 400
+    try:
+        limit = _parse_limit(request.args.get("limit"), default=20, maximum=100)
+        offset = max(0, int(request.args.get("offset") or 0))
+    except ValueError:
+        return jsonify({"error": "limit and offset must be integers"}), 400
+    if offset > MAX_SEARCH_OFFSET:
+        return jsonify({"error": f"offset must be at most {MAX_SEARCH_OFFSET}"}), 400
+
+    branches = []
+    if kind in ("all", "events"):
+        branches.append("""
+            SELECT 'event' AS kind, e.id, e.id AS event_id, e.title, e.description,
+                   e.title AS event_title,
+                   ts_rank_cd(e.search_tsv, q.tsq) + similarity(e.title, :q) AS rank
+            FROM event e, q
+            WHERE e.search_tsv @@ q.tsq OR e.title % :q
+        """)
+    if kind in ("all", "tasks"):
+        branches.append("""
+            SELECT 'task' AS kind, et.id, et.event_id, et.title, et.description,
+                   e.title AS event_title,
+                   ts_rank_cd(et.search_tsv, q.tsq) + similarity(et.title, :q) AS rank
+            FROM event_task et
+            JOIN event e ON e.id = et.event_id, q
+            WHERE et.search_tsv @@ q.tsq OR et.title % :q
+        """)
+
+    with SessionLocal() as db:
+        rows = db.execute(text(f"""
+            WITH q AS (SELECT websearch_to_tsquery('english', :q) AS tsq),
+            hits AS ({" UNION ALL ".join(branches)}),
+            page AS (
+              SELECT * FROM hits
+              ORDER BY rank DESC, id
+              LIMIT :limit OFFSET :offset
+            )
+            SELECT p.kind, p.id, p.event_id, p.title, p.event_title, p.rank,
+                   ts_headline('english', p.title, q.tsq,
+                               'StartSel={SEARCH_MARK_START}, StopSel={SEARCH_MARK_STOP}, HighlightAll=true') AS title_highlight,
+                   ts_headline('english', coalesce(p.description, ''), q.tsq,
+                               'StartSel={SEARCH_MARK_START}, StopSel={SEARCH_MARK_STOP}, MaxFragments=2, MinWords=5, MaxWords=20') AS snippet
+            FROM page p, q
+            ORDER BY p.rank DESC, p.id
+        """), {"q": q, "limit": limit + 1, "offset": offset}).mappings().all()
+
+    next_offset = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        if offset + limit <= MAX_SEARCH_OFFSET:
+            next_offset = offset + limit
+    results = [
+        {**r, "title_highlight": _highlight_html(r["title_highlight"]), "snippet": _highlight_html(r["snippet"])}
+        for r in rows
+    ]
+    return jsonify({"results": results, "next_offset": next_offset}), 200
 
 # -------------------------
 # Task Management Endpoints
 # -------------------------
 @app.post("/api/events/<uuid:event_id>/tasks")
 @jwt_required()
+@idempotent
 def create_event_task(event_id):
     """Create a new task for an event"""
     data = request.get_json()
@@ -957,6 +1876,22 @@ def create_event_task(event_id):
         if not event:
             return jsonify({"error": "Event not found"}), 404
         
+        capacity = data.get("capacity")
+        if capacity is not None:
+            try:
+                capacity = int(capacity)
+            except (TypeError, ValueError):
+                return jsonify({"error": "capacity must be an integer"}), 400
+            if capacity < 0:
+                return jsonify({"error": "capacity must be >= 0"}), 400
+        session_id = data.get("session_id")
+        if session_id:
+            sess = db.execute(text(
+                "SELECT 1 FROM event_session WHERE id = CAST(:sid AS uuid) AND event_id = :event_id"
+            ), {"sid": session_id, "event_id": event_id}).first()
+            if not sess:
+                return jsonify({"error": "Session not found for this event"}), 404
+
         # Decide skills_required
         provided_skills = _as_list(data.get("skills_required", ""))
         skills_required = provided_skills
@@ -988,9 +1923,9 @@ def create_event_task(event_id):
 
         # Create task
         task = db.execute(text("""
-            INSERT INTO event_task (event_id, title, description, skills_required, estimated_duration_min, priority, status, start_ts, end_ts)
-            VALUES (:event_id, :title, :description, :skills_required, :estimated_duration_min, :priority, :status, :start_ts, :end_ts)
-            RETURNING id, event_id, title, description, skills_required, estimated_duration_min, priority, status, assigned_to, start_ts, end_ts, registered_count, created_at, updated_at
+            INSERT INTO event_task (event_id, title, description, skills_required, estimated_duration_min, priority, status, start_ts, end_ts, capacity, session_id)
+            VALUES (:event_id, :title, :description, :skills_required, :estimated_duration_min, :priority, :status, :start_ts, :end_ts, :capacity, :session_id)
+            RETURNING id, event_id, title, description, skills_required, estimated_duration_min, priority, status, assigned_to, start_ts, end_ts, registered_count, capacity, session_id, created_at, updated_at
         """), {
             "event_id": event_id,
             "title": data["title"],
@@ -1000,7 +1935,9 @@ def create_event_task(event_id):
             "priority": data.get("priority", "medium"),
             "status": data.get("status", "open"),
             "start_ts": data.get("start_ts"),
-            "end_ts": data.get("end_ts")
+            "end_ts": data.get("end_ts"),
+            "capacity": capacity,
+            "session_id": session_id or None
         }).mappings().first()
         
         db.commit()
@@ -1008,24 +1945,88 @@ def create_event_task(event_id):
 
 @app.get("/api/events/<uuid:event_id>/tasks")
 @jwt_required()
+@conditional_get("event_task", "registration")
 def get_event_tasks(event_id):
     """Get all tasks for an event"""
     with SessionLocal() as db:
         tasks = db.execute(text("""
             SELECT 
               et.id, et.event_id, et.title, et.description, et.skills_required, et.estimated_duration_min, 
-              et.priority, et.status, et.assigned_to, et.start_ts, et.end_ts, et.registered_count,
-              et.created_at, et.updated_at,
-              EXISTS (
-                SELECT 1 FROM user_task_registration utr
-                WHERE utr.user_id = :uid AND utr.task_id = et.id
-              ) AS user_registered
+              et.priority, et.status, et.assigned_to, et.start_ts, et.end_ts, live_registered_count(et) AS registered_count, et.capacity,
+              et.created_at, et.updated_at
             FROM event_task et
             WHERE et.event_id = :event_id
             ORDER BY et.created_at DESC
-        """), {"event_id": event_id, "uid": get_jwt_identity()}).mappings().all()
+        """), {"event_id": event_id}).mappings().all()
+        my_tasks, _ = load_registered_sets(db, get_jwt_identity())
         
-        return jsonify({"tasks": [dict(t) for t in tasks]}), 200
+        return jsonify({"tasks": mark_registered(tasks, my_tasks)}), 200
+
+MAX_BATCH_EVENT_IDS = 100
+
+def _parse_uuid_list(values, limit):
+    ids = []
+    for v in values:
+        try:
+            ids.append(str(uuid.UUID(str(v))))
+        except ValueError:
+            raise ValueError(f"invalid id: {v}")
+    ids = list(dict.fromkeys(ids))
+    if len(ids) > limit:
+        raise ValueError(f"at most {limit} ids per request")
+    return ids
+
+def _tasks_grouped_by_event(event_ids):
+    """Tasks for many events from one `event_id = ANY(...)` query, grouped by event."""
+    with SessionLocal() as db:
+        rows = db.execute(text("""
+            SELECT 
+              et.id, et.event_id, et.title, et.description, et.skills_required, et.estimated_duration_min, 
+              et.priority, et.status, et.assigned_to, et.start_ts, et.end_ts, live_registered_count(et) AS registered_count, et.capacity,
+              et.created_at, et.updated_at
+            FROM event_task et
+            WHERE et.event_id = ANY(CAST(:ids AS uuid[]))
+            ORDER BY et.event_id, et.created_at DESC
+        """), {"ids": event_ids}).mappings().all()
+        my_tasks, _ = load_registered_sets(db, get_jwt_identity())
+
+    grouped = {eid: [] for eid in event_ids}
+    for t in mark_registered(rows, my_tasks):
+        grouped[str(t["event_id"])].append(t)
+    return jsonify({"tasks_by_event": grouped}), 200
+
+@app.get("/api/tasks")
+@jwt_required()
+@conditional_get("event_task", "registration")
+def get_tasks_for_events():
+    """Batch form of GET /api/events/<id>/tasks.
+
+    Query param: event_ids=<uuid>,<uuid>,... (max 100).
+    Returns { tasks_by_event: { <event_id>: [task, ...] } }.
+    """
+    try:
+        event_ids = _parse_uuid_list(_as_list(request.args.get("event_ids")), MAX_BATCH_EVENT_IDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    if not event_ids:
+        return jsonify({"error": "event_ids is required"}), 400
+    return _tasks_grouped_by_event(event_ids)
+
+@app.post("/api/tasks/batch")
+@jwt_required()
+def post_tasks_for_events():
+    """Same as GET /api/tasks for ID lists too long for a query string.
+    Body: { event_ids: [uuid, ...] } (max 100)
+    """
+    data = request.get_json(silent=True) or {}
+    raw = data.get("event_ids")
+    if not isinstance(raw, list) or not raw:
+        return jsonify({"error": "event_ids array required"}), 400
+    try:
+        event_ids = _parse_uuid_list(raw, MAX_BATCH_EVENT_IDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return _tasks_grouped_by_event(event_ids)
 
 @app.get("/api/tasks/recommended")
 @jwt_required()
@@ -1045,25 +2046,10 @@ def get_recommended_event_tasks():
         tasks = db.execute(text("""
             SELECT 
               et.id, et.event_id, et.title, et.description, et.skills_required, et.priority, et.status, 
-              et.start_ts, et.end_ts, et.registered_count, et.created_at,
-              COALESCE((
-                SELECT ARRAY(
-                  SELECT DISTINCT s
-                  FROM event_task etx, unnest(etx.skills_required) AS s
-                  WHERE etx.event_id = et.event_id AND s IS NOT NULL
-                )
-              ), ARRAY[]::TEXT[]) AS event_skills,
-              EXISTS (
-                SELECT 1 FROM user_task_registration utr1
-                WHERE utr1.user_id = :uid AND utr1.task_id = et.id
-              ) AS user_registered_task,
-              EXISTS (
-                SELECT 1 
-                FROM user_task_registration utr2
-                JOIN event_task et2 ON et2.id = utr2.task_id
-                WHERE utr2.user_id = :uid AND et2.event_id = et.event_id
-              ) AS user_registered_event
+              et.start_ts, et.end_ts, live_registered_count(et) AS registered_count, et.capacity, et.created_at,
+              COALESCE(es.skills, ARRAY[]::TEXT[]) AS event_skills
             FROM event_task et
+            LEFT JOIN event_stats es ON es.event_id = et.event_id
             WHERE et.status = 'open'
               AND NOT EXISTS (
                 SELECT 1 FROM user_task_registration utr
@@ -1071,6 +2057,9 @@ def get_recommended_event_tasks():
               )
             ORDER BY et.created_at DESC
         """), {"uid": user_id}).mappings().all()
+        my_tasks, my_events = load_registered_sets(db, user_id)
+        tasks = mark_registered(tasks, my_tasks, flag="user_registered_task")
+        tasks = mark_registered(tasks, my_events, key="event_id", flag="user_registered_event")
 
         # Gemini-based ranking if requested
         from flask import request as _rq
@@ -1097,18 +2086,13 @@ def get_registered_tasks():
         rows = db.execute(text("""
             SELECT 
               et.id, et.event_id, et.title, et.description, et.skills_required, et.priority, et.status,
-              et.start_ts, et.end_ts, et.registered_count, et.created_at, et.updated_at,
-              COALESCE((
-                SELECT ARRAY(
-                  SELECT DISTINCT s
-                  FROM event_task etx, unnest(etx.skills_required) AS s
-                  WHERE etx.event_id = et.event_id AND s IS NOT NULL
-                )
-              ), ARRAY[]::TEXT[]) AS event_skills,
+              et.start_ts, et.end_ts, live_registered_count(et) AS registered_count, et.capacity, et.created_at, et.updated_at,
+              COALESCE(es.skills, ARRAY[]::TEXT[]) AS event_skills,
               e.title AS event_title
             FROM user_task_registration utr
             JOIN event_task et ON et.id = utr.task_id
             JOIN event e ON e.id = et.event_id
+            LEFT JOIN event_stats es ON es.event_id = et.event_id
             WHERE utr.user_id = :uid
             ORDER BY et.created_at DESC
         """), {"uid": user_id}).mappings().all()
@@ -1123,30 +2107,87 @@ def get_registered_tasks():
 @app.put("/api/tasks/<uuid:task_id>/assign")
 @jwt_required()
 def assign_task(task_id):
-    """Assign a task to the current user"""
+    """Assign a task to the current user.
+
+    The availability check is the UPDATE's own WHERE clause, so of two
+    concurrent claimers exactly one gets the row.
+    """
     user_id = get_jwt_identity()
     
     with SessionLocal() as db:
-        # Check if task exists and is available
-        task = db.execute(text("""
-            SELECT id, status, assigned_to FROM event_task WHERE id = :task_id
-        """), {"task_id": task_id}).mappings().first()
-        
-        if not task:
-            return jsonify({"error": "Task not found"}), 404
-        
-        if task["status"] != "open":
-            return jsonify({"error": "Task is not available for assignment"}), 400
-        
-        # Assign task to user
-        db.execute(text("""
+        claimed = db.execute(text("""
             UPDATE event_task 
             SET assigned_to = :user_id, status = 'claimed', updated_at = now()
-            WHERE id = :task_id
-        """), {"user_id": user_id, "task_id": task_id})
-        
+            WHERE id = :task_id AND status = 'open'
+            RETURNING id
+        """), {"user_id": user_id, "task_id": task_id}).first()
+        if claimed:
+            log_change(db, "status", [task_id], user_id, {"status": "claimed"})
+        db.commit()
+        if claimed:
+            return jsonify({"message": "Task assigned successfully"}), 200
+
+        exists = db.execute(text("SELECT 1 FROM event_task WHERE id = :task_id"), {"task_id": task_id}).first()
+        if not exists:
+            return jsonify({"error": "Task not found"}), 404
+        return jsonify({"error": "Task is not available for assignment"}), 400
+
+@app.post("/api/tasks/claim-next")
+@jwt_required()
+@idempotent
+def claim_next_task():
+    """Claim the best open task for the caller's skills.
+    Optional: ?event_id=<uuid> (or in the JSON body) to stay within one event.
+
+    Candidates are ranked by skill overlap, then priority, then age. The
+    pick is locked with FOR UPDATE SKIP LOCKED, so concurrent claimers skip
+    rows another transaction is taking instead of queueing behind it, and
+    each gets a different task.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    event_id = request.args.get("event_id") or data.get("event_id")
+    where = ["et.status = 'open'", "et.assigned_to IS NULL"]
+    params = {"uid": user_id}
+    if event_id:
+        try:
+            params["event_id"] = str(uuid.UUID(str(event_id)))
+        except ValueError:
+            return jsonify({"error": "invalid event_id"}), 400
+        where.append("et.event_id = CAST(:event_id AS uuid)")
+
+    with SessionLocal() as db:
+        task = db.execute(text(f"""
+            WITH me AS (
+              SELECT COALESCE(skills, ARRAY[]::TEXT[]) AS skills FROM app_user WHERE id = :uid
+            ), pick AS (
+              SELECT et.id
+              FROM event_task et, me
+              WHERE {" AND ".join(where)}
+              ORDER BY
+                cardinality(ARRAY(
+                  SELECT unnest(COALESCE(et.skills_required, ARRAY[]::TEXT[]))
+                  INTERSECT SELECT unnest(me.skills)
+                )) DESC,
+                CASE et.priority WHEN 'high' THEN 0 WHEN 'medium' THEN 1 ELSE 2 END,
+                et.created_at, et.id
+              LIMIT 1
+              FOR UPDATE OF et SKIP LOCKED
+            )
+            UPDATE event_task et
+            SET assigned_to = :uid, status = 'claimed', updated_at = now()
+            FROM pick
+            WHERE et.id = pick.id
+            RETURNING et.id, et.event_id, et.title, et.description, et.skills_required,
+                      et.estimated_duration_min, et.priority, et.status, et.assigned_to,
+                      et.start_ts, et.end_ts, et.created_at, et.updated_at
+        """), params).mappings().first()
+        if task:
+            log_change(db, "status", [task["id"]], user_id, {"status": "claimed"})
         db.commit()
-        return jsonify({"message": "Task assigned successfully"}), 200
+    if not task:
+        return jsonify({"error": "No open tasks available"}), 404
+    return jsonify({"task": dict(task)}), 200
 
 @app.get("/api/tasks/my-tasks")
 @jwt_required()
@@ -1194,58 +2235,425 @@ def complete_task(task_id):
             SET status = 'completed', updated_at = now()
             WHERE id = :task_id
         """), {"task_id": task_id})
+        log_change(db, "status", [task_id], user_id, {"status": "completed"})
         
         db.commit()
         return jsonify({"message": "Task completed successfully"}), 200
 
+def _promote_waitlist(db, task_ids):
+    """Run promote_waitlist() for task_ids and log a change per promotion.
+
+    Returns [(task_id, user_id), ...] as strings. Runs in the caller's
+    transaction; the caller commits and invalidates the promoted users'
+    registered sets.
+    """
+    rows = db.execute(
+        text("SELECT promoted_task_id::text, promoted_user_id::text FROM promote_waitlist(CAST(:ids AS uuid[]))"),
+        {"ids": [str(t) for t in task_ids]},
+    ).all()
+    for tid, uid in rows:
+        log_change(db, "registered", [tid], uid, {"registered_delta": 1, "promoted": True})
+    return [(tid, uid) for tid, uid in rows]
+
 @app.post("/api/tasks/<uuid:task_id>/register")
 @jwt_required()
+@idempotent
 def register_for_task(task_id):
+    """Register the caller for a task, or waitlist them if it's full.
+
+    Seats on capped tasks/sessions are taken with conditional UPDATEs
+    (`registered_count < capacity`), so concurrent clicks queue on the row
+    lock and re-check the predicate instead of reading a count and racing.
+    Uncapped tasks never touch their row: the counter moves by appending to
+    event_task_count_delta. If any step doesn't stick the whole transaction
+    is rolled back. While a task has a waitlist, newcomers join the back of
+    it rather than taking a seat that freed up ahead of the queue.
+    """
     user_id = get_jwt_identity()
+    params = {"uid": user_id, "tid": task_id}
     with SessionLocal() as db:
-        exists = db.execute(text("""
-            SELECT 1 FROM user_task_registration WHERE user_id=:uid AND task_id=:tid
-        """), {"uid": user_id, "tid": task_id}).first()
-        if exists:
-            return jsonify({"message": "Already registered"}), 200
+        try:
+            res = db.execute(text("""
+                WITH t AS (
+                  SELECT et.id, et.capacity, et.session_id, es.capacity AS session_capacity,
+                         EXISTS (
+                           SELECT 1 FROM task_waitlist w
+                           WHERE w.task_id = et.id AND w.user_id <> :uid
+                         ) AS queued
+                  FROM event_task et
+                  LEFT JOIN event_session es ON es.id = et.session_id
+                  WHERE et.id = :tid
+                    AND NOT EXISTS (
+                      SELECT 1 FROM user_task_registration r
+                      WHERE r.task_id = et.id AND r.user_id = :uid
+                    )
+                ), sess AS (
+                  UPDATE event_session s
+                  SET registered_count = s.registered_count + 1
+                  FROM t
+                  WHERE s.id = t.session_id AND NOT t.queued
+                    AND s.capacity IS NOT NULL AND s.registered_count < s.capacity
+                  RETURNING s.id
+                ), seat AS (
+                  UPDATE event_task et
+                  SET registered_count = COALESCE(et.registered_count,0) + 1, updated_at=now()
+                  FROM t
+                  WHERE et.id = t.id AND NOT t.queued
+                    AND et.capacity IS NOT NULL AND COALESCE(et.registered_count,0) < et.capacity
+                    AND (t.session_capacity IS NULL OR EXISTS (SELECT 1 FROM sess))
+                  RETURNING et.id
+                ), granted AS (
+                  SELECT id FROM seat
+                  UNION ALL
+                  SELECT id FROM t
+                  WHERE t.capacity IS NULL AND NOT t.queued
+                    AND (t.session_capacity IS NULL OR EXISTS (SELECT 1 FROM sess))
+                ), ins AS (
+                  INSERT INTO user_task_registration (user_id, task_id)
+                  SELECT :uid, id FROM granted
+                  ON CONFLICT DO NOTHING
+                  RETURNING task_id
+                ), cnt AS (
+                  INSERT INTO event_task_count_delta (task_id, delta)
+                  SELECT ins.task_id, 1 FROM ins JOIN t ON t.id = ins.task_id
+                  WHERE t.capacity IS NULL
+                ), unwait AS (
+                  DELETE FROM task_waitlist
+                  WHERE task_id = :tid AND user_id = :uid AND EXISTS (SELECT 1 FROM ins)
+                )
+                SELECT (SELECT COUNT(*) FROM t) AS candidate,
+                       (SELECT COUNT(*) FROM granted) AS seated,
+                       (SELECT COUNT(*) FROM ins) AS inserted
+            """), params).mappings().first()
+        except IntegrityError:
+            db.rollback()
+            return jsonify({"error": "User not found"}), 404
 
-        ok = db.execute(text("""
-            INSERT INTO user_task_registration (user_id, task_id)
-            VALUES (:uid, :tid)
-            RETURNING user_id
-        """), {"uid": user_id, "tid": task_id}).first()
-        if not ok:
-            return jsonify({"error": "Unable to register"}), 400
+        if res["inserted"]:
+            log_change(db, "registered", [task_id], user_id, {"registered_delta": 1})
+            db.commit()
+            invalidate_registered_sets(user_id)
+            return jsonify({"message": "Registered"}), 200
+
+        # Nothing inserted: undo any seat we took on the way
+        db.rollback()
+        if not res["candidate"]:
+            exists = db.execute(text("SELECT 1 FROM event_task WHERE id = :tid"), params).first()
+            if not exists:
+                return jsonify({"error": "Task not found"}), 404
+            return jsonify({"message": "Already registered"}), 200
+        if res["seated"]:
+            # lost an ON CONFLICT race with our own concurrent request
+            return jsonify({"message": "Already registered"}), 200
 
         db.execute(text("""
-            UPDATE event_task 
-            SET registered_count = COALESCE(registered_count,0) + 1, updated_at=now()
-            WHERE id = :tid
-        """), {"tid": task_id})
+            INSERT INTO task_waitlist (task_id, user_id)
+            VALUES (:tid, :uid)
+            ON CONFLICT (task_id, user_id) DO NOTHING
+        """), params)
+        # Seats can be free behind a queue whose head was locked by a concurrent
+        # promotion; serve the queue now, which may include the caller.
+        promoted = _promote_waitlist(db, [task_id])
+        if (str(task_id), str(user_id)) in promoted:
+            db.commit()
+            invalidate_registered_sets(*{u for _, u in promoted})
+            return jsonify({"message": "Registered"}), 200
+        position = db.execute(text("""
+            SELECT COUNT(*) FROM task_waitlist w
+            WHERE w.task_id = :tid
+              AND w.id <= (SELECT id FROM task_waitlist WHERE task_id = :tid AND user_id = :uid)
+        """), params).scalar()
         db.commit()
-        return jsonify({"message": "Registered"}), 200
+    if promoted:
+        invalidate_registered_sets(*{u for _, u in promoted})
+    return jsonify({"message": "Waitlisted", "position": position}), 202
 
 @app.delete("/api/tasks/<uuid:task_id>/register")
 @jwt_required()
+@idempotent
 def unregister_for_task(task_id):
+    """Release the caller's seat and hand it to the waitlist.
+
+    The seat is freed with the same per-row rules as register (capped rows
+    update in place, uncapped tasks log a -1 delta), then promote_waitlist()
+    serves the queues in the same transaction: this task's, and those of
+    tasks sharing its session, since a session seat may be what they were
+    waiting on. Waiters are taken FOR UPDATE SKIP LOCKED, so concurrent
+    unregisters promote different users.
+    """
     user_id = get_jwt_identity()
+    params = {"uid": user_id, "tid": task_id}
     with SessionLocal() as db:
-        existed = db.execute(text("""
-            DELETE FROM user_task_registration 
-            WHERE user_id=:uid AND task_id=:tid
-            RETURNING 1
-        """), {"uid": user_id, "tid": task_id}).first()
+        res = db.execute(text("""
+            WITH del AS (
+              DELETE FROM user_task_registration
+              WHERE user_id=:uid AND task_id=:tid
+              RETURNING task_id
+            ), t AS (
+              SELECT et.id, et.capacity, et.session_id, es.capacity AS session_capacity
+              FROM event_task et
+              LEFT JOIN event_session es ON es.id = et.session_id
+              WHERE et.id IN (SELECT task_id FROM del)
+            ), upd AS (
+              UPDATE event_task
+              SET registered_count = GREATEST(COALESCE(registered_count,0) - 1, 0), updated_at=now()
+              WHERE id IN (SELECT id FROM t WHERE capacity IS NOT NULL)
+            ), cnt AS (
+              INSERT INTO event_task_count_delta (task_id, delta)
+              SELECT id, -1 FROM t WHERE capacity IS NULL
+            ), supd AS (
+              UPDATE event_session s
+              SET registered_count = GREATEST(s.registered_count - 1, 0)
+              WHERE s.id IN (SELECT session_id FROM t WHERE session_capacity IS NOT NULL)
+            ), unwait AS (
+              DELETE FROM task_waitlist
+              WHERE task_id = :tid AND user_id = :uid AND NOT EXISTS (SELECT 1 FROM del)
+              RETURNING id
+            )
+            SELECT (SELECT COUNT(*) FROM del) AS deleted,
+                   (SELECT COUNT(*) FROM unwait) AS unwaited
+        """), params).mappings().first()
+        promoted = []
+        if res["deleted"]:
+            log_change(db, "unregistered", [task_id], user_id, {"registered_delta": -1})
+            promoted = _promote_waitlist(db, [task_id])
+        db.commit()
+    if res["deleted"]:
+        invalidate_registered_sets(user_id, *{u for _, u in promoted})
+        return jsonify({"message": "Unregistered", "promoted": any(t == str(task_id) for t, _ in promoted)}), 200
+    if res["unwaited"]:
+        return jsonify({"message": "Removed from waitlist"}), 200
+    return jsonify({"message": "Not registered"}), 200
 
-        if not existed:
-            return jsonify({"message": "Not registered"}), 200
+MAX_BULK_REGISTER_IDS = 200
 
-        db.execute(text("""
-            UPDATE event_task 
-            SET registered_count = GREATEST(COALESCE(registered_count,0) - 1, 0), updated_at=now()
-            WHERE id = :tid
-        """), {"tid": task_id})
+@app.post("/api/tasks/register")
+@jwt_required()
+@idempotent
+def bulk_register_for_tasks():
+    """Register the caller for many tasks in one transaction.
+    Body: { task_ids: [uuid, ...] } (max 200)
+
+    Same seat rules as the single-task endpoint, set-based: one grouped
+    conditional UPDATE per table takes seats (a session seat is all-or-nothing
+    for the tasks requested in it), one unnest INSERT writes the
+    registrations, and full (or already queued) tasks go on their waitlists,
+    which are then served by promote_waitlist(). A second statement only runs
+    to hand back seats taken for rows that weren't inserted. The capped
+    session and task rows are locked up front in id order (sessions first,
+    as on the single-task path), so overlapping bulk requests queue on each
+    other instead of deadlocking.
+    Returns a per-task status: registered, already_registered, waitlisted
+    or not_found.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    raw = data.get("task_ids")
+    if not isinstance(raw, list) or not raw:
+        return jsonify({"error": "task_ids array required"}), 400
+    try:
+        task_ids = _parse_uuid_list(raw, MAX_BULK_REGISTER_IDS)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    params = {"uid": user_id, "ids": task_ids}
+    with SessionLocal() as db:
+        try:
+            db.execute(text("""
+                SELECT 1 FROM event_session
+                WHERE capacity IS NOT NULL
+                  AND id IN (SELECT session_id FROM event_task WHERE id = ANY(CAST(:ids AS uuid[])))
+                ORDER BY id
+                FOR UPDATE
+            """), params)
+            db.execute(text("""
+                SELECT 1 FROM event_task
+                WHERE capacity IS NOT NULL AND id = ANY(CAST(:ids AS uuid[]))
+                ORDER BY id
+                FOR UPDATE
+            """), params)
+            rows = db.execute(text("""
+                WITH req AS (
+                  SELECT u.id FROM unnest(CAST(:ids AS uuid[])) AS u(id)
+                ), t AS (
+                  SELECT et.id, et.capacity, et.session_id, es.capacity AS session_capacity,
+                         EXISTS (
+                           SELECT 1 FROM task_waitlist w
+                           WHERE w.task_id = et.id AND w.user_id <> :uid
+                         ) AS queued
+                  FROM event_task et
+                  JOIN req ON req.id = et.id
+                  LEFT JOIN event_session es ON es.id = et.session_id
+                  WHERE NOT EXISTS (
+                    SELECT 1 FROM user_task_registration r
+                    WHERE r.task_id = et.id AND r.user_id = :uid
+                  )
+                ), demand AS (
+                  SELECT session_id, COUNT(*) AS k
+                  FROM t WHERE session_capacity IS NOT NULL AND NOT queued
+                  GROUP BY session_id
+                ), sess AS (
+                  UPDATE event_session s
+                  SET registered_count = s.registered_count + d.k
+                  FROM demand d
+                  WHERE s.id = d.session_id AND s.registered_count + d.k <= s.capacity
+                  RETURNING s.id
+                ), seat AS (
+                  UPDATE event_task et
+                  SET registered_count = COALESCE(et.registered_count,0) + 1, updated_at=now()
+                  FROM t
+                  WHERE et.id = t.id AND NOT t.queued
+                    AND et.capacity IS NOT NULL AND COALESCE(et.registered_count,0) < et.capacity
+                    AND (t.session_capacity IS NULL OR t.session_id IN (SELECT id FROM sess))
+                  RETURNING et.id
+                ), granted AS (
+                  SELECT id FROM seat
+                  UNION ALL
+                  SELECT id FROM t
+                  WHERE t.capacity IS NULL AND NOT t.queued
+                    AND (t.session_capacity IS NULL OR t.session_id IN (SELECT id FROM sess))
+                ), ins AS (
+                  INSERT INTO user_task_registration (user_id, task_id)
+                  SELECT :uid, id FROM granted
+                  ON CONFLICT DO NOTHING
+                  RETURNING task_id
+                ), cnt AS (
+                  INSERT INTO event_task_count_delta (task_id, delta)
+                  SELECT t.id, 1 FROM ins JOIN t ON t.id = ins.task_id
+                  WHERE t.capacity IS NULL
+                ), unwait AS (
+                  DELETE FROM task_waitlist w
+                  USING ins
+                  WHERE w.task_id = ins.task_id AND w.user_id = :uid
+                )
+                SELECT
+                  req.id AS task_id,
+                  EXISTS (SELECT 1 FROM event_task x WHERE x.id = req.id) AS found,
+                  req.id IN (SELECT id FROM t) AS candidate,
+                  req.id IN (SELECT id FROM granted) AS granted,
+                  req.id IN (SELECT id FROM seat) AS seated,
+                  req.id IN (SELECT task_id FROM ins) AS inserted,
+                  (SELECT t.session_id FROM t
+                   WHERE t.id = req.id AND t.session_capacity IS NOT NULL
+                     AND t.session_id IN (SELECT id FROM sess)) AS held_session
+                FROM req
+            """), params).mappings().all()
+        except IntegrityError:
+            db.rollback()
+            return jsonify({"error": "User not found"}), 404
+
+        # Seats taken for rows that lost an ON CONFLICT race or whose task was full
+        undo_tasks = [str(r["task_id"]) for r in rows if r["seated"] and not r["inserted"]]
+        undo_sessions = Counter(str(r["held_session"]) for r in rows if r["held_session"] and not r["inserted"])
+        if undo_tasks or undo_sessions:
+            db.execute(text("""
+                WITH t AS (
+                  UPDATE event_task
+                  SET registered_count = GREATEST(COALESCE(registered_count,0) - 1, 0), updated_at=now()
+                  WHERE id = ANY(CAST(:tids AS uuid[]))
+                )
+                UPDATE event_session s
+                SET registered_count = GREATEST(s.registered_count - u.n, 0)
+                FROM unnest(CAST(:sids AS uuid[]), CAST(:ns AS int[])) AS u(id, n)
+                WHERE s.id = u.id
+            """), {"tids": undo_tasks, "sids": list(undo_sessions), "ns": list(undo_sessions.values())})
+
+        full = [str(r["task_id"]) for r in rows if r["candidate"] and not r["granted"]]
+        positions = {}
+        promoted = []
+        if full:
+            db.execute(text("""
+                INSERT INTO task_waitlist (task_id, user_id)
+                SELECT u.id, :uid FROM unnest(CAST(:ids AS uuid[])) AS u(id)
+                ON CONFLICT (task_id, user_id) DO NOTHING
+            """), {"uid": user_id, "ids": full})
+            promoted = _promote_waitlist(db, full)
+            positions = dict(db.execute(text("""
+                SELECT w.task_id::text,
+                       (SELECT COUNT(*) FROM task_waitlist x WHERE x.task_id = w.task_id AND x.id <= w.id)
+                FROM task_waitlist w
+                WHERE w.user_id = :uid AND w.task_id = ANY(CAST(:ids AS uuid[]))
+            """), {"uid": user_id, "ids": full}).all())
+        log_change(db, "registered", [r["task_id"] for r in rows if r["inserted"]], user_id, {"registered_delta": 1})
         db.commit()
-        return jsonify({"message": "Unregistered"}), 200
+
+    mine = {t for t, u in promoted if u == str(user_id)}
+    results = []
+    for r in rows:
+        tid = str(r["task_id"])
+        if r["inserted"] or tid in mine:
+            results.append({"task_id": tid, "status": "registered"})
+        elif not r["found"]:
+            results.append({"task_id": tid, "status": "not_found"})
+        elif tid in positions:
+            results.append({"task_id": tid, "status": "waitlisted", "position": positions[tid]})
+        else:
+            results.append({"task_id": tid, "status": "already_registered"})
+    registered = sum(1 for r in results if r["status"] == "registered")
+    if registered or promoted:
+        invalidate_registered_sets(user_id, *{u for _, u in promoted})
+    return jsonify({"results": results, "registered": registered}), 200
+
+@app.get("/api/changes/stream")
+@jwt_required()
+def stream_changes():
+    """Server-Sent Events stream of registration and task-status changes.
+
+    Each event carries the change_log id as its SSE id, so a reconnecting
+    EventSource resumes from Last-Event-ID (or ?since=<id>) and gets the
+    missed rows replayed before live ones. Payloads are deltas
+    (registered_delta, status) for clients to patch their state in place;
+    `mine` marks the caller's own changes instead of exposing user ids.
+    """
+    user_id = str(get_jwt_identity())
+    since = request.headers.get("Last-Event-ID") or request.args.get("since")
+    try:
+        since = int(since) if since else None
+    except ValueError:
+        return jsonify({"error": "since must be an integer change id"}), 400
+
+    q = subscribe_changes()
+    replay = []
+    if since is not None:
+        with SessionLocal() as db:
+            replay = db.execute(text("""
+                SELECT id, kind, event_id, task_id, user_id, payload, created_at
+                FROM change_log
+                WHERE id > :since
+                ORDER BY id
+                LIMIT :limit
+            """), {"since": since, "limit": CHANGE_FEED_REPLAY_LIMIT}).mappings().all()
+
+    def fmt(msg):
+        msg = dict(msg)
+        msg["mine"] = str(msg.pop("user_id", None)) == user_id
+        return f"id: {msg['id']}\nevent: {msg['kind']}\ndata: {json.dumps(msg, default=_json_default)}\n\n"
+
+    def gen():
+        try:
+            yield "retry: 3000\n\n"
+            replayed = set()
+            for r in replay:
+                replayed.add(r["id"])
+                yield fmt(r)
+            while True:
+                try:
+                    msg = q.get(timeout=15)
+                except queue.Empty:
+                    with _feed_lock:
+                        dropped = q not in _feed_subscribers
+                    if dropped:
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if msg["id"] in replayed:
+                    continue
+                yield fmt(msg)
+        finally:
+            unsubscribe_changes(q)
+
+    return Response(gen(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # -------------------------
 # Home Page Endpoints
@@ -1265,8 +2673,14 @@ def get_recommended_tasks():
 
 @app.get("/api/home/trending-events")
 @jwt_required()
+@conditional_get("event", "event_task", "registration")
 def get_trending_events():
-    """Top 5 events ranked by total registrations across their tasks"""
+    """Top 5 events by time-decayed registrations (7-day half-life).
+
+    Reads the precomputed event_stats.trending_score through its index, so
+    this is a top-N index scan rather than a sort over every event. The
+    ranking lags by at most one counter fold; it stays on the index on purpose.
+    """
     user_id = get_jwt_identity()
     with SessionLocal() as db:
         rows = db.execute(text("""
@@ -1275,23 +2689,21 @@ def get_trending_events():
               e.location_city, e.location_state, e.is_remote, e.causes,
               e.skills_needed, e.tags, e.min_duration_min, e.rsvp_url, e.contact_email,
               e.created_at, e.updated_at,
-              COALESCE((SELECT SUM(registered_count)::int FROM event_task et WHERE et.event_id = e.id), 0) AS total_registered_count,
-              (SELECT MIN(start_ts) FROM event_task et WHERE et.event_id = e.id) AS event_start_ts,
-              (SELECT MAX(end_ts)   FROM event_task et WHERE et.event_id = e.id) AS event_end_ts,
-              EXISTS (
-                SELECT 1
-                FROM user_task_registration utr
-                JOIN event_task et2 ON et2.id = utr.task_id
-                WHERE utr.user_id = :uid AND et2.event_id = e.id
-              ) AS user_registered
-            FROM event e
-            ORDER BY total_registered_count DESC NULLS LAST, e.created_at DESC
+              live_registration_count(s) AS total_registered_count,
+              s.trending_score / trending_weight(now()) AS trending_score,
+              s.start_ts AS event_start_ts,
+              s.end_ts AS event_end_ts
+            FROM event_stats s
+            JOIN event e ON e.id = s.event_id
+            ORDER BY s.trending_score DESC, s.event_id
             LIMIT 5
-        """), {"uid": user_id}).mappings().all()
-    return jsonify({"events": [dict(r) for r in rows]}), 200
+        """)).mappings().all()
+        _, my_events = load_registered_sets(db, user_id)
+    return jsonify({"events": mark_registered(rows, my_events)}), 200
 
 @app.get("/api/home/analytics")
 @jwt_required()
+@conditional_get("event", "event_task", "registration", "app_user")
 def get_analytics():
     """Get user analytics dashboard data (computed)"""
     user_id = get_jwt_identity()
@@ -1393,107 +2805,58 @@ def get_analytics():
 
 @app.get("/api/home/communities")
 @jwt_required()
+@conditional_get("registration", "app_user", "directory")
+@analytics_cache("registration", "app_user", "directory", per_user=True)
 def get_communities():
-    """Get user's communities and leaderboard ranked by registrations."""
+    """Get user's communities and leaderboard ranked by registrations, plus the
+    caller's own rank among volunteers by registered minutes.
+
+    Ranks are 1 + COUNT(*) of higher scores, an index range count on
+    leaderboard_score / idx_user_registration_stats_minutes: cost grows with
+    the rank, which the per-user cache absorbs.
+    """
     user_id = get_jwt_identity()
 
     with SessionLocal() as db:
-        me = db.execute(text("""
-            SELECT department_id, erg_id FROM app_user WHERE id = :uid
-        """), {"uid": user_id}).mappings().first()
+        # Rank within the category = 1 + entries with a higher score (ties share a rank)
+        mine = db.execute(text("""
+            SELECT CASE ls.kind WHEN 'department' THEN 'Dept: ' || d.name ELSE 'ERG: ' || e.name END AS name,
+                   1 + (SELECT COUNT(*) FROM leaderboard_score o
+                        WHERE o.kind = ls.kind AND o.score > ls.score) AS rank
+            FROM app_user au
+            JOIN leaderboard_score ls
+              ON (ls.kind = 'department' AND ls.entity_id = au.department_id)
+              OR (ls.kind = 'erg' AND ls.entity_id = au.erg_id)
+            LEFT JOIN department d ON ls.kind = 'department' AND d.id = ls.entity_id
+            LEFT JOIN erg e ON ls.kind = 'erg' AND e.id = ls.entity_id
+            WHERE au.id = :uid
+            ORDER BY ls.kind
+        """), {"uid": user_id}).mappings().all()
 
-        # Department leaderboard
-        dept_rows = db.execute(text("""
-            SELECT d.id AS id, 'department'::text AS kind, d.name AS name,
-                   COALESCE(COUNT(utr.user_id), 0) AS score
-            FROM department d
-            LEFT JOIN app_user au ON au.department_id = d.id
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            GROUP BY d.id, d.name
-        """)).mappings().all()
+        volunteer = db.execute(text("""
+            SELECT COALESCE(me.minutes, 0) AS minutes,
+                   1 + (SELECT COUNT(*) FROM user_registration_stats o
+                        WHERE o.minutes > COALESCE(me.minutes, 0)) AS rank
+            FROM (SELECT 1) one
+            LEFT JOIN user_registration_stats me ON me.user_id = :uid
+        """), {"uid": user_id}).mappings().first()
 
-        # ERG leaderboard
-        erg_rows = db.execute(text("""
-            SELECT e.id AS id, 'erg'::text AS kind, e.name AS name,
-                   COALESCE(COUNT(utr.user_id), 0) AS score
-            FROM erg e
-            LEFT JOIN app_user au ON au.erg_id = e.id
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            GROUP BY e.id, e.name
+        # Overall top 10 across both categories
+        top = db.execute(text("""
+            SELECT CASE ls.kind WHEN 'department' THEN 'Dept: ' || d.name ELSE 'ERG: ' || e.name END AS name,
+                   ls.score
+            FROM leaderboard_score ls
+            LEFT JOIN department d ON ls.kind = 'department' AND d.id = ls.entity_id
+            LEFT JOIN erg e ON ls.kind = 'erg' AND e.id = ls.entity_id
+            ORDER BY ls.score DESC, 1
+            LIMIT 10
         """)).mappings().all()
 
-    # Build combined list for overall leaderboard
-    combined = []
-    for r in dept_rows:
-        combined.append({
-            "id": r["id"],
-            "kind": r["kind"],
-            "name": f"Dept: {r['name']}",
-            "score": int(r["score"] or 0),
-        })
-    for r in erg_rows:
-        combined.append({
-            "id": r["id"],
-            "kind": r["kind"],
-            "name": f"ERG: {r['name']}",
-            "score": int(r["score"] or 0),
-        })
-
-    # Overall dense ranking across both categories
-    combined.sort(key=lambda x: (-x["score"], x["name"]))
-    last_score = None
-    rank = 0
-    for i, item in enumerate(combined):
-        if item["score"] != last_score:
-            rank = i + 1
-            last_score = item["score"]
-        item["rank"] = rank
-
-    # Category-specific dense ranking maps
-    def build_rank_map(rows, name_key):
-        arr = [{"id": r["id"], "name": r[name_key], "score": int(r["score"] or 0)} for r in rows]
-        arr.sort(key=lambda x: (-x["score"], x["name"]))
-        mp = {}
-        last = None
-        rk = 0
-        for i, it in enumerate(arr):
-            if it["score"] != last:
-                rk = i + 1
-                last = it["score"]
-            mp[it["id"]] = rk
-        return mp
-
-    dept_rank_map = build_rank_map(dept_rows, "name")
-    erg_rank_map = build_rank_map(erg_rows, "name")
-
-    # User communities with ranks
-    user_communities = []
-    if me:
-        if me.get("department_id") is not None:
-            # Use category rank for department
-            dep_id = me["department_id"]
-            dep_name_row = next((r for r in dept_rows if r["id"] == dep_id), None)
-            if dep_name_row:
-                user_communities.append({
-                    "name": f"Dept: {dep_name_row['name']}",
-                    "rank": dept_rank_map.get(dep_id, None)
-                })
-        if me.get("erg_id") is not None:
-            # Use category rank for ERG
-            erg_id_val = me["erg_id"]
-            erg_name_row = next((r for r in erg_rows if r["id"] == erg_id_val), None)
-            if erg_name_row:
-                user_communities.append({
-                    "name": f"ERG: {erg_name_row['name']}",
-                    "rank": erg_rank_map.get(erg_id_val, None)
-                })
-
-    # Only show top 10 entries on the user view
-    combined_top = combined[:10]
-    return jsonify({
-        "user_communities": user_communities,
-        "leaderboard": [{"name": c["name"], "score": c["score"]} for c in combined_top]
-    }), 200
+    return {
+        "user_communities": [{"name": r["name"], "rank": int(r["rank"])} for r in mine],
+        "leaderboard": [{"name": r["name"], "score": int(r["score"] or 0)} for r in top],
+        "my_rank": {"rank": int(volunteer["rank"]), "minutes": int(volunteer["minutes"])}
+    }, 200
 
 # -------------------------
 # Admin: Backfill/normalize task skills to exactly three per task
@@ -1570,10 +2933,52 @@ def backfill_task_skills():
         db.commit()
     return jsonify({"updated": updated}), 200
 # -------------------------
+# Admin: Recompute event_stats (trending scores, counters) from source rows
+# -------------------------
+@app.post("/api/admin/refresh_event_stats")
+@jwt_required()
+def refresh_event_stats():
+    """Periodic job: rebuild every event_stats row from event_task and
+    user_task_registration. Triggers keep the rollup current incrementally;
+    this corrects float drift in trending_score and any counter skew. The
+    trending epoch is re-anchored first if it is due (rebase_trending_epoch).
+    """
+    with SessionLocal() as db:
+        db.execute(text("SELECT rebase_trending_epoch(interval '28 days')"))
+        refreshed = db.execute(text(
+            "SELECT refresh_event_stats(e.id) FROM event e"
+        )).all()
+        db.commit()
+    return jsonify({"refreshed": len(refreshed)}), 200
+
+@app.post("/api/admin/rebuild_registration_facts")
+@jwt_required()
+def rebuild_registration_facts():
+    """Rebuild registration_daily and user_registration_stats from scratch.
+    Triggers keep them current; this is for repairs. Blocks registrations while it runs.
+    """
+    with SessionLocal() as db:
+        db.execute(text("SELECT rebuild_registration_facts()"))
+        db.commit()
+        days = db.execute(text("SELECT COUNT(DISTINCT day) FROM registration_daily")).scalar()
+    return jsonify({"days": days}), 200
+
+@app.post("/api/admin/fold_counters")
+@jwt_required()
+def fold_counters():
+    """Fold pending registration deltas into event_task / event_stats now.
+
+    A background thread does this every COUNTER_FOLD_INTERVAL_SECONDS; this
+    is for deployments that disable it and run the fold from a scheduler.
+    """
+    return jsonify({"folded": fold_counter_deltas()}), 200
+
+# -------------------------
 # Admin: Reset and seed events and LLM subtasks
 # -------------------------
 @app.post("/api/admin/reset_and_seed_events")
 @jwt_required()
+@idempotent
 def reset_and_seed_events():
     """Deletes all existing event_task rows, creates events from payload, and
     generates LLM subtasks for each event.
@@ -1596,6 +3001,7 @@ def reset_and_seed_events():
         # Delete all existing subtasks only
         db.execute(text("DELETE FROM event_task"))
         db.commit()
+        invalidate_registered_sets()
 
         for it in items:
             title = (it.get("task") or "Event").strip()
@@ -1669,6 +3075,7 @@ def reset_and_seed_events():
 # -------------------------
 @app.post("/api/admin/seed_leaderboard")
 @jwt_required()
+@idempotent
 def seed_leaderboard():
     """Create a synthetic event/task and add fake users with registrations
     to generate leaderboard points for departments and ERGs. Only shows top 10
@@ -1773,9 +3180,13 @@ def seed_leaderboard():
 # -------------------------
 @app.post("/api/admin/bulk_register")
 @jwt_required()
+@idempotent
 def bulk_register_users_for_tasks():
     """Body: { emails: string[], min_tasks?: int, max_tasks?: int }
     For each email, register the user to 3-4 random open tasks (no duplicates).
+    Set-based: one email = ANY lookup and one unnest INSERT that logs the counter
+    deltas. Only tasks with no task or session capacity are picked, so this never
+    oversells a seat or jumps a waitlist.
     """
     payload = request.get_json(silent=True) or {}
     emails = payload.get("emails") or []
@@ -1787,35 +3198,47 @@ def bulk_register_users_for_tasks():
     if max_tasks < min_tasks: max_tasks = min_tasks
 
     with SessionLocal() as db:
-        # Fetch open tasks once
-        open_tasks = db.execute(text(
-            "SELECT id FROM event_task WHERE status='open'"
-        )).scalars().all()
+        # Fetch open, uncapped tasks once
+        open_tasks = db.execute(text("""
+            SELECT et.id FROM event_task et
+            LEFT JOIN event_session es ON es.id = et.session_id
+            WHERE et.status='open' AND et.capacity IS NULL AND es.capacity IS NULL
+        """)).scalars().all()
         if not open_tasks:
             return jsonify({"error": "no open tasks"}), 400
 
-        done = {}
-        for email in emails:
-            user = db.execute(text("SELECT id FROM app_user WHERE email=:e"), {"e": email}).mappings().first()
-            if not user:
-                done[email] = 0
-                continue
+        users = db.execute(text(
+            "SELECT email, id FROM app_user WHERE email = ANY(:emails)"
+        ), {"emails": emails}).all()
+
+        # Pick tasks per user here, then write every pair in one statement
+        uids, tids = [], []
+        for email, uid in users:
             k = random.randint(min_tasks, max_tasks)
-            chosen = random.sample(open_tasks, k if k <= len(open_tasks) else len(open_tasks))
-            cnt = 0
-            for tid in chosen:
-                try:
-                    db.execute(text(
-                        "INSERT INTO user_task_registration (user_id, task_id) VALUES (:uid, :tid) ON CONFLICT DO NOTHING"
-                    ), {"uid": user["id"], "tid": tid})
-                    db.execute(text(
-                        "UPDATE event_task SET registered_count = COALESCE(registered_count,0) + 1, updated_at=now() WHERE id=:tid"
-                    ), {"tid": tid})
-                    cnt += 1
-                except Exception:
-                    pass
-            done[email] = cnt
+            for tid in random.sample(open_tasks, min(k, len(open_tasks))):
+                uids.append(str(uid))
+                tids.append(str(tid))
+
+        # Counters move by the rows actually inserted (ON CONFLICT skips don't count)
+        inserted = dict(db.execute(text("""
+            WITH ins AS (
+              INSERT INTO user_task_registration (user_id, task_id)
+              SELECT p.user_id, p.task_id
+              FROM unnest(CAST(:uids AS uuid[]), CAST(:tids AS uuid[])) AS p(user_id, task_id)
+              ON CONFLICT DO NOTHING
+              RETURNING user_id, task_id
+            ), cnt AS (
+              INSERT INTO event_task_count_delta (task_id, delta)
+              SELECT task_id, COUNT(*) FROM ins GROUP BY task_id
+            )
+            SELECT user_id::text, COUNT(*) FROM ins GROUP BY user_id
+        """), {"uids": uids, "tids": tids}).all())
         db.commit()
+
+    by_email = {email: str(uid) for email, uid in users}
+    done = {email: inserted.get(by_email.get(email), 0) for email in emails}
+    if inserted:
+        invalidate_registered_sets(*inserted.keys())
     return jsonify({"registered": done}), 200
 
 
@@ -1824,9 +3247,12 @@ def bulk_register_users_for_tasks():
 # -------------------------
 @app.post("/api/admin/assign_random_communities")
 @jwt_required()
+@idempotent
 def assign_random_communities():
     """Body: { emails: string[], min?: int, max?: int }
     Assign 1-2 random communities per user and append their skills to app_user.skills (deduped).
+    Runs as one statement: random picks via a LATERAL join, skills merged in SQL.
+    Returns a summary: users, memberships_added, skills_updated, not_found.
     """
     payload = request.get_json(silent=True) or {}
     emails = payload.get("emails") or []
@@ -1838,46 +3264,54 @@ def assign_random_communities():
     if max_n < min_n: max_n = min_n
 
     with SessionLocal() as db:
-        comms = db.execute(text("SELECT id, skill1, skill2, skill3 FROM community" )).mappings().all()
-        if not comms:
+        if not db.execute(text("SELECT 1 FROM community LIMIT 1")).first():
             return jsonify({"error": "no communities found"}), 400
-        by_email = {}
-        for email in emails:
-            u = db.execute(text("SELECT id, skills FROM app_user WHERE email=:e"), {"e": email}).mappings().first()
-            if not u:
-                by_email[email] = 0
-                continue
-            k = random.randint(min_n, max_n)
-            chosen = random.sample(comms, k if k <= len(comms) else len(comms))
-            # Insert memberships
-            assigned = 0
-            for c in chosen:
-                try:
-                    db.execute(text(
-                        "INSERT INTO user_community (user_id, community_id) VALUES (:uid, :cid) ON CONFLICT DO NOTHING"
-                    ), {"uid": u["id"], "cid": c["id"]})
-                    assigned += 1
-                except Exception:
-                    pass
-            # Merge skills
-            cur = list(u.get("skills") or [])
-            add = [c.get("skill1"), c.get("skill2"), c.get("skill3")] if chosen else []
-            # Flatten from all chosen
-            add_all = []
-            for c in chosen:
-                for s in [c.get("skill1"), c.get("skill2"), c.get("skill3")]:
-                    if s:
-                        add_all.append(s)
-            merged = []
-            for s in (cur + add_all):
-                if s and s not in merged:
-                    merged.append(s)
-            db.execute(text(
-                "UPDATE app_user SET skills=:skills, updated_at=now() WHERE id=:uid"
-            ), {"skills": merged, "uid": u["id"]})
-            by_email[email] = assigned
+        summary = db.execute(text("""
+            WITH target AS (
+              SELECT id, (:min_n + floor(random() * (:max_n - :min_n + 1)))::int AS k
+              FROM app_user
+              WHERE email = ANY(:emails)
+            ), pick AS (
+              SELECT t.id AS user_id, c.id AS community_id, c.skill1, c.skill2, c.skill3
+              FROM target t
+              CROSS JOIN LATERAL (
+                SELECT * FROM community ORDER BY random() LIMIT t.k
+              ) c
+            ), ins AS (
+              INSERT INTO user_community (user_id, community_id)
+              SELECT user_id, community_id FROM pick
+              ON CONFLICT DO NOTHING
+              RETURNING user_id
+            ), adds AS (
+              SELECT p.user_id, array_agg(j.sk ORDER BY p.community_id, j.ord) AS add
+              FROM pick p, unnest(ARRAY[p.skill1, p.skill2, p.skill3]) WITH ORDINALITY AS j(sk, ord)
+              WHERE j.sk IS NOT NULL
+              GROUP BY p.user_id
+            ), merged AS (
+              -- append, dropping repeats but keeping first-seen order
+              SELECT a.id,
+                     ARRAY(
+                       SELECT x.s FROM unnest(COALESCE(a.skills, ARRAY[]::TEXT[]) || d.add) WITH ORDINALITY AS x(s, ord)
+                       WHERE x.s IS NOT NULL
+                       GROUP BY x.s ORDER BY MIN(x.ord)
+                     ) AS skills
+              FROM app_user a JOIN adds d ON d.user_id = a.id
+            ), upd AS (
+              UPDATE app_user a
+              SET skills = m.skills, updated_at = now()
+              FROM merged m
+              WHERE a.id = m.id AND a.skills IS DISTINCT FROM m.skills
+              RETURNING a.id
+            )
+            SELECT
+              (SELECT COUNT(*) FROM target) AS users,
+              (SELECT COUNT(*) FROM ins) AS memberships_added,
+              (SELECT COUNT(*) FROM upd) AS skills_updated,
+              (SELECT COALESCE(array_agg(e), ARRAY[]::TEXT[]) FROM unnest(CAST(:emails AS TEXT[])) AS e
+                WHERE NOT EXISTS (SELECT 1 FROM app_user WHERE email = e)) AS not_found
+        """), {"emails": emails, "min_n": min_n, "max_n": max_n}).mappings().first()
         db.commit()
-    return jsonify({"communities_assigned": by_email}), 200
+    return jsonify(dict(summary)), 200
 
 
 # -------------------------
@@ -1885,224 +3319,142 @@ def assign_random_communities():
 # -------------------------
 @app.post("/api/admin/assign_random_ergs")
 @jwt_required()
+@idempotent
 def assign_random_ergs():
     """Body: { emails?: string[], only_missing?: bool }
     - If emails provided: target those accounts; otherwise target all users.
     - If only_missing=true: restrict to users with NULL erg_id.
     - Sets app_user.erg_id and app_user.erg from a random ERG and appends ERG skills.
+    Runs as one UPDATE over the whole target set; returns counts per ERG.
     """
     payload = request.get_json(silent=True) or {}
     emails = payload.get("emails")
     only_missing = bool(payload.get("only_missing", True))
 
+    where = []
+    params = {"erg_skills": json.dumps(ERG_SKILLS_MAP)}
+    if emails and isinstance(emails, list):
+        where.append("email = ANY(:emails)")
+        params["emails"] = emails
+    if only_missing:
+        where.append("erg_id IS NULL")
+
     with SessionLocal() as db:
-        ergs = db.execute(text("SELECT id, name FROM erg" )).mappings().all()
-        if not ergs:
+        if not db.execute(text("SELECT 1 FROM erg LIMIT 1")).first():
             return jsonify({"error": "no ERGs found"}), 400
-
-        if emails and isinstance(emails, list) and emails:
-            if only_missing:
-                users = db.execute(text(
-                    "SELECT id, email, skills FROM app_user WHERE email = ANY(:emails) AND erg_id IS NULL"
-                ), {"emails": emails}).mappings().all()
-            else:
-                users = db.execute(text(
-                    "SELECT id, email, skills FROM app_user WHERE email = ANY(:emails)"
-                ), {"emails": emails}).mappings().all()
-        else:
-            if only_missing:
-                users = db.execute(text(
-                    "SELECT id, email, skills FROM app_user WHERE erg_id IS NULL"
-                )).mappings().all()
-            else:
-                users = db.execute(text(
-                    "SELECT id, email, skills FROM app_user"
-                )).mappings().all()
-
-        updated = {}
-        for u in users:
-            choice = random.choice(ergs)
-            db.execute(text(
-                "UPDATE app_user SET erg_id=:eid, erg=:ename, updated_at=now() WHERE id=:uid"
-            ), {"eid": choice["id"], "ename": choice["name"], "uid": u["id"]})
-
-            # Append ERG skills if mapping exists
-            try:
-                erg_skills = ERG_SKILLS_MAP.get(choice["name"])  # type: ignore
-            except Exception:
-                erg_skills = None
-            current = list(u.get("skills") or [])
-            if erg_skills:
-                merged = []
-                for s in (current + list(erg_skills)):
-                    if s and s not in merged:
-                        merged.append(s)
-                db.execute(text(
-                    "UPDATE app_user SET skills=:skills, updated_at=now() WHERE id=:uid"
-                ), {"skills": merged, "uid": u["id"]})
-            updated[u["email"]] = choice["name"]
-
+        rows = db.execute(text(f"""
+            WITH ergs AS (
+              SELECT id, name, (row_number() OVER (ORDER BY id) - 1)::int AS idx FROM erg
+            ), pick AS (
+              SELECT id AS user_id, floor(random() * (SELECT COUNT(*) FROM erg))::int AS idx
+              FROM app_user
+              {"WHERE " + " AND ".join(where) if where else ""}
+            ), chosen AS (
+              SELECT p.user_id, e.id AS erg_id, e.name
+              FROM pick p JOIN ergs e ON e.idx = p.idx
+            ), merged AS (
+              -- append the ERG's implied skills, dropping repeats but keeping first-seen order
+              SELECT c.user_id, c.erg_id, c.name,
+                     ARRAY(
+                       SELECT x.s
+                       FROM unnest(
+                         COALESCE(a.skills, ARRAY[]::TEXT[]) ||
+                         ARRAY(SELECT jsonb_array_elements_text(
+                           COALESCE(CAST(:erg_skills AS jsonb) -> c.name, '[]'::jsonb)))
+                       ) WITH ORDINALITY AS x(s, ord)
+                       WHERE x.s IS NOT NULL
+                       GROUP BY x.s ORDER BY MIN(x.ord)
+                     ) AS skills
+              FROM chosen c JOIN app_user a ON a.id = c.user_id
+            ), upd AS (
+              UPDATE app_user a
+              SET erg_id = m.erg_id, erg = m.name, skills = m.skills, updated_at = now()
+              FROM merged m
+              WHERE a.id = m.user_id
+              RETURNING m.name
+            )
+            SELECT name, COUNT(*) FROM upd GROUP BY name ORDER BY name
+        """), params).all()
         db.commit()
-    return jsonify({"assigned": updated}), 200
+    by_erg = {name: n for name, n in rows}
+    return jsonify({"assigned": sum(by_erg.values()), "by_erg": by_erg}), 200
 # -------------------------
 # Company Analytics Endpoints
 # -------------------------
-@app.get("/api/company/overview")
-@jwt_required()
-def get_company_overview():
-    """Company-wide overview statistics from live data"""
-    now = datetime.now(timezone.utc)
+def _analytics_windows(now):
+    """Date boundaries shared by the company analytics queries."""
     start_this_month = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
     prev_month_year = start_this_month.year if start_this_month.month > 1 else start_this_month.year - 1
     prev_month_month = start_this_month.month - 1 if start_this_month.month > 1 else 12
     start_prev_month = start_this_month.replace(year=prev_month_year, month=prev_month_month)
+    return {
+        "this_month": start_this_month.date(),
+        "prev_month": start_prev_month.date(),
+        "year_start": now.replace(month=1, day=1).date(),
+        "d90": (now - timedelta(days=90)).date(),
+        "d60": now - timedelta(days=60),
+        "d30": (now - timedelta(days=30)).date(),
+        "d14": (now - timedelta(days=14)).date(),
+        "d7": (now - timedelta(days=7)).date(),
+    }
 
-    with SessionLocal() as db:
-        total_employees = db.execute(text("SELECT COUNT(*) FROM app_user")).scalar() or 0
-        active_volunteers = db.execute(text("SELECT COUNT(DISTINCT user_id) FROM user_task_registration")).scalar() or 0
-        total_minutes = db.execute(text(
-            """
-            SELECT COALESCE(SUM(et.estimated_duration_min),0)
-            FROM user_task_registration utr
-            JOIN event_task et ON et.id = utr.task_id
-            """
-        )).scalar() or 0
-        total_hours = int(round(total_minutes / 60))
-        total_events_completed = db.execute(text("SELECT COUNT(*) FROM event_task WHERE status='completed'" )).scalar() or 0
-        avg_hours_per_volunteer = (total_hours / active_volunteers) if active_volunteers else 0
-
-        current_month_regs = db.execute(text(
-            "SELECT COUNT(*) FROM user_task_registration WHERE registered_at >= :t"
-        ), {"t": start_this_month}).scalar() or 0
-        prev_month_regs = db.execute(text(
-            "SELECT COUNT(*) FROM user_task_registration WHERE registered_at >= :a AND registered_at < :b"
-        ), {"a": start_prev_month, "b": start_this_month}).scalar() or 0
-        growth_percentage = 0
-        if prev_month_regs:
-            growth_percentage = int(round((current_month_regs - prev_month_regs) * 100 / prev_month_regs))
-
-        top_departments = db.execute(text(
-            """
-            SELECT d.name AS name, COALESCE(COUNT(utr.user_id),0) AS score
-            FROM department d
-            LEFT JOIN app_user au ON au.department_id = d.id
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            GROUP BY d.name
-            ORDER BY score DESC, d.name ASC
-            LIMIT 5
-            """
-        )).mappings().all()
-
+def _overview_payload(r, top_departments):
+    total_employees = int(r["total_employees"] or 0)
+    active_volunteers = int(r["active_volunteers"] or 0)
+    total_hours = int(round((r["minutes"] or 0) / 60))
+    avg_hours_per_volunteer = (total_hours / active_volunteers) if active_volunteers else 0
+    current_month_regs = int(r["current_month"] or 0)
+    prev_month_regs = int(r["previous_month"] or 0)
+    growth_percentage = 0
+    if prev_month_regs:
+        growth_percentage = int(round((current_month_regs - prev_month_regs) * 100 / prev_month_regs))
     return {
         "total_employees": total_employees,
         "active_volunteers": active_volunteers,
         "participation_rate": int(round((active_volunteers * 100) / total_employees)) if total_employees else 0,
         "total_hours_volunteered": total_hours,
-        "total_events_completed": total_events_completed,
+        "total_events_completed": int(r["events_completed"] or 0),
         "average_hours_per_volunteer": int(round(avg_hours_per_volunteer)),
-        "top_departments": [{"name": r["name"], "score": int(r["score"] or 0)} for r in top_departments],
+        "top_departments": [{"name": d["name"], "score": int(d["score"] or 0)} for d in top_departments],
         "monthly_trends": {
             "current_month": current_month_regs,
             "previous_month": prev_month_regs,
             "growth_percentage": growth_percentage
         }
-    }, 200
-
-@app.get("/api/company/engagement")
-@jwt_required()
-def get_engagement_metrics():
-    """Employee engagement and participation metrics"""
-    now = datetime.now(timezone.utc)
-    last_90 = now - timedelta(days=90)
-    last_60 = now - timedelta(days=60)
-
-    with SessionLocal() as db:
-        total_users = db.execute(text("SELECT COUNT(*) FROM app_user")).scalar() or 0
-        rows = db.execute(text(
-            """
-            SELECT au.id AS user_id, COALESCE(COUNT(utr.user_id),0) AS cnt
-            FROM app_user au
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            GROUP BY au.id
-            """
-        )).mappings().all()
-        cnts = [int(r["cnt"] or 0) for r in rows]
-        highly = sum(1 for c in cnts if c >= 5)
-        moderate = sum(1 for c in cnts if 2 <= c <= 4)
-        low = sum(1 for c in cnts if c == 1)
-        none = sum(1 for c in cnts if c == 0)
-
-        skills90 = db.execute(text(
-            """
-            SELECT DISTINCT s
-            FROM user_task_registration utr
-            JOIN event_task et ON et.id = utr.task_id
-            CROSS JOIN LATERAL UNNEST(et.skills_required) AS s
-            WHERE utr.registered_at >= :t
-            """
-        ), {"t": last_90}).scalars().all()
-        new_skills = len([s for s in skills90 if s])
-        minutes90 = db.execute(text(
-            """
-            SELECT COALESCE(SUM(et.estimated_duration_min),0)
-            FROM user_task_registration utr
-            JOIN event_task et ON et.id = utr.task_id
-            WHERE utr.registered_at >= :t
-            """
-        ), {"t": last_90}).scalar() or 0
-        learning_hours = int(round(minutes90 / 60))
-        skill_counts = db.execute(text(
-            """
-            SELECT s AS skill, COUNT(*) AS c
-            FROM user_task_registration utr
-            JOIN event_task et ON et.id = utr.task_id
-            CROSS JOIN LATERAL UNNEST(et.skills_required) AS s
-            GROUP BY s
-            ORDER BY c DESC
-            LIMIT 5
-            """
-        )).mappings().all()
-
-        active_volunteers = db.execute(text("SELECT COUNT(DISTINCT user_id) FROM user_task_registration")).scalar() or 0
-        recent_active = db.execute(text(
-            "SELECT COUNT(DISTINCT user_id) FROM user_task_registration WHERE registered_at >= :t"
-        ), {"t": last_60}).scalar() or 0
-        retention_rate = int(round((recent_active * 100) / active_volunteers)) if active_volunteers else 0
+    }
 
+def _engagement_payload(r, skill_categories):
+    total_users = int(r["total_users"] or 0)
+    def pct(n):
+        return int(round(int(n or 0) * 100 / total_users)) if total_users else 0
+    active_volunteers = int(r["active_volunteers"] or 0)
+    recent_active = int(r["recent_active"] or 0)
     return {
         "participation_breakdown": {
-            "highly_engaged": int(round(highly * 100 / total_users)) if total_users else 0,
-            "moderately_engaged": int(round(moderate * 100 / total_users)) if total_users else 0,
-            "low_engagement": int(round(low * 100 / total_users)) if total_users else 0,
-            "not_participated": int(round(none * 100 / total_users)) if total_users else 0
+            "highly_engaged": pct(r["highly"]),
+            "moderately_engaged": pct(r["moderate"]),
+            "low_engagement": pct(r["low"]),
+            "not_participated": pct(r["not_participated"])
         },
         "department_participation": [],
         "skill_development": {
-            "new_skills_learned": new_skills,
-            "skill_categories": [r["skill"] for r in skill_counts],
-            "learning_hours": learning_hours
+            "new_skills_learned": int(r["new_skills"] or 0),
+            "skill_categories": list(skill_categories),
+            "learning_hours": int(round((r["minutes90"] or 0) / 60))
         },
         "retention_impact": {
-            "volunteer_retention_rate": retention_rate,
+            "volunteer_retention_rate": int(round((recent_active * 100) / active_volunteers)) if active_volunteers else 0,
             "satisfaction_score": 0,
             "recommendation_rate": 0
         }
-    }, 200
+    }
 
-@app.get("/api/company/impact")
-@jwt_required()
-def get_impact_analytics():
-    """Community impact and social value metrics"""
-    with SessionLocal() as db:
-        communities_served = db.execute(text(
-            "SELECT COUNT(DISTINCT department_id) FROM app_user au JOIN user_task_registration utr ON utr.user_id = au.id"
-        )).scalar() or 0
-        projects_completed = db.execute(text("SELECT COUNT(*) FROM event_task WHERE status='completed'" )).scalar() or 0
+def _impact_payload(communities_served, projects_completed):
     return {
         "community_impact": {
-            "communities_served": communities_served,
+            "communities_served": int(communities_served or 0),
             "people_helped": 0,
-            "projects_completed": projects_completed,
+            "projects_completed": int(projects_completed or 0),
             "social_value_created": 0
         },
         "cause_areas": {},
@@ -2116,24 +3468,11 @@ def get_impact_analytics():
             "waste_diverted": 0,
             "renewable_energy_hours": 0
         }
-    }, 200
+    }
 
-@app.get("/api/company/progress")
-@jwt_required()
-def get_progress_tracking():
-    """Get progress tracking for goals and milestones (events-based)"""
-    now = datetime.now(timezone.utc)
-    start_year = now.replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
+def _progress_payload(events_ytd, now):
+    events_ytd = int(events_ytd or 0)
     end_year = now.replace(month=12, day=31, hour=23, minute=59, second=59, microsecond=0)
-    with SessionLocal() as db:
-        events_ytd = db.execute(text(
-            """
-            SELECT COALESCE(COUNT(DISTINCT et.event_id),0)
-            FROM user_task_registration utr
-            JOIN event_task et ON et.id = utr.task_id
-            WHERE utr.registered_at >= :start
-            """
-        ), {"start": start_year}).scalar() or 0
     target = 100
     pct = int(round((events_ytd * 100) / target)) if target else 0
     days_remaining = (end_year.date() - now.date()).days
@@ -2157,86 +3496,375 @@ def get_progress_tracking():
             "q3": {"hours": 0, "events": 0, "participants": 0},
             "q4": {"hours": 0, "events": 0, "participants": 0}
         }
-    }, 200
+    }
+
+def _leaderboard_payload(top_vol, dept, erg):
+    return {
+        "top_volunteers": [{"name": r["full_name"] or "User", "score": int(round((r["minutes"] or 0) / 60))} for r in top_vol],
+        "department_rankings": [{"name": r["name"], "score": int(r["score"] or 0)} for r in dept],
+        "erg_rankings": [{"name": r["name"], "score": int(r["score"] or 0)} for r in erg]
+    }
+
+def _trends_payload(r):
+    last30_regs = int(r["last30"] or 0)
+    daily_avg = round(last30_regs / 30, 2)
+    last7, prev7 = int(r["last7"] or 0), int(r["prev7"] or 0)
+    forecast = "stable"
+    if prev7:
+        delta = (last7 - prev7) / prev7
+        forecast = "rising" if delta > 0.1 else ("falling" if delta < -0.1 else "stable")
+    return {
+        "participation_trends": {"daily_average": daily_avg},
+        "predictive_insights": {"projected_hours": int(round((r["minutes_month"] or 0) / 60)), "engagement_forecast": forecast}
+    }
+
+@app.get("/api/company/overview")
+@jwt_required()
+@conditional_get("event_task", "registration", "app_user", "directory")
+@analytics_cache("event_task", "registration", "app_user", "directory")
+def get_company_overview():
+    """Company-wide overview statistics from live data"""
+    w = _analytics_windows(datetime.now(timezone.utc))
+    with SessionLocal() as db:
+        # Registration totals come from the registration_daily rollup (skill = '' rows)
+        r = db.execute(text(
+            """
+            SELECT (SELECT COUNT(*) FROM app_user) AS total_employees,
+                   (SELECT COUNT(*) FROM user_registration_stats WHERE registrations > 0) AS active_volunteers,
+                   (SELECT COUNT(*) FROM event_task WHERE status='completed') AS events_completed,
+                   COALESCE(SUM(minutes),0) AS minutes,
+                   COALESCE(SUM(registrations) FILTER (WHERE day >= :this_month),0) AS current_month,
+                   COALESCE(SUM(registrations) FILTER (WHERE day >= :prev_month AND day < :this_month),0) AS previous_month
+            FROM registration_daily
+            WHERE skill = ''
+            """
+        ), {"this_month": w["this_month"], "prev_month": w["prev_month"]}).mappings().first()
+
+        top_departments = db.execute(text(
+            """
+            SELECT d.name AS name, ls.score
+            FROM leaderboard_score ls
+            JOIN department d ON d.id = ls.entity_id
+            WHERE ls.kind = 'department'
+            ORDER BY ls.score DESC, d.name ASC
+            LIMIT 5
+            """
+        )).mappings().all()
+
+    return _overview_payload(r, top_departments), 200
+
+@app.get("/api/company/engagement")
+@jwt_required()
+@conditional_get("event_task", "registration", "app_user")
+@analytics_cache("event_task", "registration", "app_user")
+def get_engagement_metrics():
+    """Employee engagement and participation metrics"""
+    w = _analytics_windows(datetime.now(timezone.utc))
+
+    with SessionLocal() as db:
+        # Bucket counts straight off user_registration_stats; users without a
+        # stats row (never registered) are "not participated" by subtraction.
+        counts = dict(db.execute(text(
+            """
+            SELECT (SELECT COUNT(*) FROM app_user) AS total_users,
+                   COUNT(*) FILTER (WHERE registrations >= 5) AS highly,
+                   COUNT(*) FILTER (WHERE registrations BETWEEN 2 AND 4) AS moderate,
+                   COUNT(*) FILTER (WHERE registrations = 1) AS low,
+                   COUNT(*) FILTER (WHERE registrations > 0) AS active_volunteers,
+                   COUNT(*) FILTER (WHERE registrations > 0 AND last_registered_at >= :t) AS recent_active
+            FROM user_registration_stats
+            """
+        ), {"t": w["d60"]}).mappings().first())
+        counts["not_participated"] = max(counts["total_users"] - counts["active_volunteers"], 0)
+
+        counts["new_skills"] = db.execute(text(
+            """
+            SELECT COUNT(*) FROM (
+              SELECT skill
+              FROM registration_daily
+              WHERE skill <> '' AND day >= :t
+              GROUP BY skill
+              HAVING SUM(registrations) > 0
+            ) s
+            """
+        ), {"t": w["d90"]}).scalar() or 0
+        counts["minutes90"] = db.execute(text(
+            "SELECT COALESCE(SUM(minutes),0) FROM registration_daily WHERE skill = '' AND day >= :t"
+        ), {"t": w["d90"]}).scalar() or 0
+        skill_counts = db.execute(text(
+            """
+            SELECT skill, SUM(registrations) AS c
+            FROM registration_daily
+            WHERE skill <> ''
+            GROUP BY skill
+            HAVING SUM(registrations) > 0
+            ORDER BY c DESC, skill
+            LIMIT 5
+            """
+        )).mappings().all()
+
+    return _engagement_payload(counts, [r["skill"] for r in skill_counts]), 200
+
+@app.get("/api/company/impact")
+@jwt_required()
+@conditional_get("event_task", "registration", "app_user")
+@analytics_cache("event_task", "registration", "app_user")
+def get_impact_analytics():
+    """Community impact and social value metrics"""
+    with SessionLocal() as db:
+        communities_served = db.execute(text(
+            """
+            SELECT COUNT(*) FROM (
+              SELECT department_id FROM registration_daily
+              WHERE skill = '' AND department_id <> 0
+              GROUP BY department_id HAVING SUM(registrations) > 0
+            ) d
+            """
+        )).scalar() or 0
+        projects_completed = db.execute(text("SELECT COUNT(*) FROM event_task WHERE status='completed'" )).scalar() or 0
+    return _impact_payload(communities_served, projects_completed), 200
+
+@app.get("/api/company/progress")
+@jwt_required()
+@conditional_get("event_task", "registration")
+@analytics_cache("event_task", "registration", ttl=300)
+def get_progress_tracking():
+    """Get progress tracking for goals and milestones (events-based)"""
+    now = datetime.now(timezone.utc)
+    with SessionLocal() as db:
+        events_ytd = db.execute(text(
+            """
+            SELECT COUNT(*) FROM (
+              SELECT event_id FROM registration_daily
+              WHERE skill = '' AND day >= :start
+              GROUP BY event_id HAVING SUM(registrations) > 0
+            ) e
+            """
+        ), {"start": _analytics_windows(now)["year_start"]}).scalar() or 0
+    return _progress_payload(events_ytd, now), 200
 
 @app.get("/api/company/leaderboard")
 @jwt_required()
+@conditional_get("event_task", "registration", "app_user", "directory")
+@analytics_cache("event_task", "registration", "app_user", "directory")
 def get_company_leaderboard():
     """Get company-wide leaderboard"""
     with SessionLocal() as db:
+        # Top-N reads walk the (kind, score DESC) / (minutes DESC) indexes
         top_vol = db.execute(text(
             """
-            SELECT au.full_name, COALESCE(SUM(et.estimated_duration_min),0) AS minutes
-            FROM app_user au
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            LEFT JOIN event_task et ON et.id = utr.task_id
-            GROUP BY au.full_name
-            ORDER BY minutes DESC, au.full_name ASC
+            SELECT au.full_name, s.minutes
+            FROM user_registration_stats s
+            JOIN app_user au ON au.id = s.user_id
+            ORDER BY s.minutes DESC, au.full_name ASC
             LIMIT 10
             """
         )).mappings().all()
 
         dept = db.execute(text(
             """
-            SELECT d.name, COALESCE(COUNT(utr.user_id),0) AS score
-            FROM department d
-            LEFT JOIN app_user au ON au.department_id = d.id
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            GROUP BY d.name
-            ORDER BY score DESC, d.name ASC
+            SELECT d.name, ls.score
+            FROM leaderboard_score ls
+            JOIN department d ON d.id = ls.entity_id
+            WHERE ls.kind = 'department'
+            ORDER BY ls.score DESC, d.name ASC
             LIMIT 10
             """
         )).mappings().all()
 
         erg = db.execute(text(
             """
-            SELECT e.name, COALESCE(COUNT(utr.user_id),0) AS score
-            FROM erg e
-            LEFT JOIN app_user au ON au.erg_id = e.id
-            LEFT JOIN user_task_registration utr ON utr.user_id = au.id
-            GROUP BY e.name
-            ORDER BY score DESC, e.name ASC
+            SELECT e.name, ls.score
+            FROM leaderboard_score ls
+            JOIN erg e ON e.id = ls.entity_id
+            WHERE ls.kind = 'erg'
+            ORDER BY ls.score DESC, e.name ASC
             LIMIT 10
             """
         )).mappings().all()
 
-    return {
-        "top_volunteers": [{"name": r["full_name"] or "User", "score": int(round((r["minutes"] or 0) / 60))} for r in top_vol],
-        "department_rankings": [{"name": r["name"], "score": int(r["score"] or 0)} for r in dept],
-        "erg_rankings": [{"name": r["name"], "score": int(r["score"] or 0)} for r in erg]
-    }, 200
+    return _leaderboard_payload(top_vol, dept, erg), 200
 
 @app.get("/api/company/trends")
 @jwt_required()
+@conditional_get("event_task", "registration")
+@analytics_cache("event_task", "registration")
 def get_company_trends():
     """Get trending data and predictive analytics"""
+    w = _analytics_windows(datetime.now(timezone.utc))
+    with SessionLocal() as db:
+        # One pass over the last ~month of registration_daily for every window
+        r = db.execute(text(
+            """
+            SELECT
+              COALESCE(SUM(registrations) FILTER (WHERE day >= :d30),0) AS last30,
+              COALESCE(SUM(registrations) FILTER (WHERE day >= :d7),0) AS last7,
+              COALESCE(SUM(registrations) FILTER (WHERE day >= :d14 AND day < :d7),0) AS prev7,
+              COALESCE(SUM(minutes) FILTER (WHERE day >= :month),0) AS minutes_month
+            FROM registration_daily
+            WHERE skill = '' AND day >= LEAST(CAST(:d30 AS date), CAST(:month AS date))
+            """
+        ), {"d30": w["d30"], "d7": w["d7"], "d14": w["d14"], "month": w["this_month"]}).mappings().first()
+
+    return _trends_payload(r), 200
+
+# Sections of the dashboard statement, in the order they appear in its select
+# list; the clock_timestamp() columns between them give the per-section timing.
+DASHBOARD_SECTIONS = ("overview", "engagement", "impact", "progress", "leaderboard", "trends")
+
+@app.get("/api/company/dashboard")
+@jwt_required()
+@conditional_get("event_task", "registration", "app_user", "directory")
+@analytics_cache("event_task", "registration", "app_user", "directory")
+def get_company_dashboard():
+    """All company analytics sections computed in one statement.
+
+    The shared rollups (registration totals, per-user buckets, department/ERG
+    and skill scores) are MATERIALIZED CTEs, so each is scanned once however
+    many sections read it. Sections are uncorrelated scalar subqueries that
+    Postgres evaluates left to right, and the clock_timestamp() columns between
+    them time each one; a shared CTE's cost lands in the first section that
+    reads it. timings_ms belong to the computation stamped in computed_at:
+    cache hits replay them, so they are not the cost of the request at hand.
+    """
     now = datetime.now(timezone.utc)
-    last_30 = now - timedelta(days=30)
+    w = _analytics_windows(now)
+    started = time.perf_counter()
     with SessionLocal() as db:
-        last30_regs = db.execute(text(
-            "SELECT COUNT(*) FROM user_task_registration WHERE registered_at >= :t"
-        ), {"t": last_30}).scalar() or 0
-        daily_avg = round(last30_regs / 30, 2)
-
-        last7 = db.execute(text("SELECT COUNT(*) FROM user_task_registration WHERE registered_at >= :t"), {"t": now - timedelta(days=7)}).scalar() or 0
-        prev7 = db.execute(text("SELECT COUNT(*) FROM user_task_registration WHERE registered_at >= :a AND registered_at < :b"), {"a": now - timedelta(days=14), "b": now - timedelta(days=7)}).scalar() or 0
-        forecast = "stable"
-        if prev7:
-            delta = (last7 - prev7) / prev7
-            forecast = "rising" if delta > 0.1 else ("falling" if delta < -0.1 else "stable")
-
-        minutes_month = db.execute(text(
+        r = db.execute(text(
             """
-            SELECT COALESCE(SUM(et.estimated_duration_min),0)
-            FROM user_task_registration utr
-            JOIN event_task et ON et.id = utr.task_id
-            WHERE utr.registered_at >= :t
+            WITH tot AS MATERIALIZED (
+              SELECT COALESCE(SUM(minutes),0) AS minutes,
+                     COALESCE(SUM(registrations) FILTER (WHERE day >= :this_month),0) AS current_month,
+                     COALESCE(SUM(registrations) FILTER (WHERE day >= :prev_month AND day < :this_month),0) AS previous_month,
+                     COALESCE(SUM(minutes) FILTER (WHERE day >= :d90),0) AS minutes90,
+                     COALESCE(SUM(registrations) FILTER (WHERE day >= :d30),0) AS last30,
+                     COALESCE(SUM(registrations) FILTER (WHERE day >= :d7),0) AS last7,
+                     COALESCE(SUM(registrations) FILTER (WHERE day >= :d14 AND day < :d7),0) AS prev7,
+                     COALESCE(SUM(minutes) FILTER (WHERE day >= :this_month),0) AS minutes_month
+              FROM registration_daily
+              WHERE skill = ''
+            ),
+            people AS MATERIALIZED (
+              SELECT u.n AS total_users,
+                     COUNT(*) FILTER (WHERE s.registrations > 0) AS active_volunteers,
+                     COUNT(*) FILTER (WHERE s.registrations >= 5) AS highly,
+                     COUNT(*) FILTER (WHERE s.registrations BETWEEN 2 AND 4) AS moderate,
+                     COUNT(*) FILTER (WHERE s.registrations = 1) AS low,
+                     GREATEST(u.n - COUNT(*) FILTER (WHERE s.registrations > 0), 0) AS not_participated,
+                     COUNT(*) FILTER (WHERE s.registrations > 0 AND s.last_registered_at >= :d60) AS recent_active
+              FROM (SELECT COUNT(*) AS n FROM app_user) u
+              LEFT JOIN user_registration_stats s ON true
+              GROUP BY u.n
+            ),
+            completed AS MATERIALIZED (
+              SELECT COUNT(*) AS n FROM event_task WHERE status='completed'
+            ),
+            dept_scores AS MATERIALIZED (
+              SELECT d.name, ls.score
+              FROM leaderboard_score ls
+              JOIN department d ON d.id = ls.entity_id
+              WHERE ls.kind = 'department'
+            ),
+            erg_scores AS MATERIALIZED (
+              SELECT e.name, ls.score
+              FROM leaderboard_score ls
+              JOIN erg e ON e.id = ls.entity_id
+              WHERE ls.kind = 'erg'
+            ),
+            skill_totals AS MATERIALIZED (
+              SELECT skill,
+                     SUM(registrations) AS total,
+                     SUM(registrations) FILTER (WHERE day >= :d90) AS recent
+              FROM registration_daily
+              WHERE skill <> ''
+              GROUP BY skill
+            )
+            SELECT
+              clock_timestamp() AS t0,
+              (SELECT json_build_object(
+                 'total_employees', p.total_users,
+                 'active_volunteers', p.active_volunteers,
+                 'events_completed', c.n,
+                 'minutes', t.minutes,
+                 'current_month', t.current_month,
+                 'previous_month', t.previous_month,
+                 'top_departments', (
+                   SELECT COALESCE(json_agg(json_build_object('name', x.name, 'score', x.score) ORDER BY x.score DESC, x.name), '[]'::json)
+                   FROM (SELECT name, score FROM dept_scores ORDER BY score DESC, name LIMIT 5) x))
+               FROM people p, tot t, completed c) AS overview,
+              clock_timestamp() AS t1,
+              (SELECT json_build_object(
+                 'total_users', p.total_users,
+                 'highly', p.highly,
+                 'moderate', p.moderate,
+                 'low', p.low,
+                 'not_participated', p.not_participated,
+                 'active_volunteers', p.active_volunteers,
+                 'recent_active', p.recent_active,
+                 'minutes90', t.minutes90,
+                 'new_skills', (SELECT COUNT(*) FROM skill_totals WHERE recent > 0),
+                 'skill_categories', (
+                   SELECT COALESCE(json_agg(x.skill ORDER BY x.total DESC, x.skill), '[]'::json)
+                   FROM (SELECT skill, total FROM skill_totals WHERE total > 0 ORDER BY total DESC, skill LIMIT 5) x))
+               FROM people p, tot t) AS engagement,
+              clock_timestamp() AS t2,
+              (SELECT json_build_object(
+                 'communities_served', (SELECT COUNT(*) FROM dept_scores WHERE score > 0),
+                 'projects_completed', c.n)
+               FROM completed c) AS impact,
+              clock_timestamp() AS t3,
+              (SELECT COUNT(*) FROM (
+                 SELECT event_id FROM registration_daily
+                 WHERE skill = '' AND day >= :year_start
+                 GROUP BY event_id HAVING SUM(registrations) > 0
+               ) e) AS progress,
+              clock_timestamp() AS t4,
+              (SELECT json_build_object(
+                 'top_volunteers', (
+                   SELECT COALESCE(json_agg(json_build_object('full_name', x.full_name, 'minutes', x.minutes) ORDER BY x.minutes DESC, x.full_name), '[]'::json)
+                   FROM (
+                     SELECT au.full_name, s.minutes
+                     FROM user_registration_stats s
+                     JOIN app_user au ON au.id = s.user_id
+                     ORDER BY s.minutes DESC, au.full_name ASC
+                     LIMIT 10
+                   ) x),
+                 'departments', (
+                   SELECT COALESCE(json_agg(json_build_object('name', x.name, 'score', x.score) ORDER BY x.score DESC, x.name), '[]'::json)
+                   FROM (SELECT name, score FROM dept_scores ORDER BY score DESC, name LIMIT 10) x),
+                 'ergs', (
+                   SELECT COALESCE(json_agg(json_build_object('name', x.name, 'score', x.score) ORDER BY x.score DESC, x.name), '[]'::json)
+                   FROM (SELECT name, score FROM erg_scores ORDER BY score DESC, name LIMIT 10) x))) AS leaderboard,
+              clock_timestamp() AS t5,
+              (SELECT json_build_object(
+                 'last30', t.last30,
+                 'last7', t.last7,
+                 'prev7', t.prev7,
+                 'minutes_month', t.minutes_month)
+               FROM tot t) AS trends,
+              clock_timestamp() AS t6
             """
-        ), {"t": now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)}).scalar() or 0
+        ), w).mappings().first()
+    total_ms = (time.perf_counter() - started) * 1000
+
+    marks = [r[f"t{i}"] for i in range(len(DASHBOARD_SECTIONS) + 1)]
+    timings = {
+        name: round((marks[i + 1] - marks[i]).total_seconds() * 1000, 2)
+        for i, name in enumerate(DASHBOARD_SECTIONS)
+    }
+    timings["total_ms"] = round(total_ms, 2)
 
+    board = r["leaderboard"]
     return {
-        "participation_trends": {"daily_average": daily_avg},
-        "predictive_insights": {"projected_hours": int(round(minutes_month / 60)), "engagement_forecast": forecast}
+        "overview": _overview_payload(r["overview"], r["overview"]["top_departments"]),
+        "engagement": _engagement_payload(r["engagement"], r["engagement"]["skill_categories"]),
+        "impact": _impact_payload(r["impact"]["communities_served"], r["impact"]["projects_completed"]),
+        "progress": _progress_payload(r["progress"], now),
+        "leaderboard": _leaderboard_payload(board["top_volunteers"], board["departments"], board["ergs"]),
+        "trends": _trends_payload(r["trends"]),
+        "computed_at": now.isoformat(),
+        "timings_ms": timings,
     }, 200
 
 @app.post("/api/admin/test_gemini_subtasks")
@@ -2287,83 +3915,275 @@ def get_all_users():
             "total": len(users)
         }), 200
 
+# -------------------------
+# Admin: Streaming exports (NDJSON / CSV)
+# -------------------------
+EXPORT_QUERIES: dict[str, str] = {
+    "events": """
+        SELECT e.id, e.organization_id, e.title, e.description, e.mode,
+               e.location_city, e.location_state, e.location_lat, e.location_lng,
+               e.is_remote, e.causes, e.skills_needed, e.accessibility, e.tags,
+               e.min_duration_min, e.rsvp_url, e.contact_email, e.created_at, e.updated_at
+        FROM event e
+        ORDER BY e.created_at, e.id
+    """,
+    "tasks": """
+        SELECT et.id, et.event_id, et.title, et.description, et.skills_required,
+               et.estimated_duration_min, et.priority, et.status, et.assigned_to,
+               et.start_ts, et.end_ts, live_registered_count(et) AS registered_count, et.capacity, et.created_at, et.updated_at
+        FROM event_task et
+        ORDER BY et.created_at, et.id
+    """,
+    "registrations": """
+        SELECT utr.user_id, au.email, utr.task_id, et.event_id, utr.registered_at
+        FROM user_task_registration utr
+        JOIN app_user au ON au.id = utr.user_id
+        JOIN event_task et ON et.id = utr.task_id
+        ORDER BY utr.registered_at, utr.user_id, utr.task_id
+    """,
+    "users": """
+        SELECT u.id, u.email, u.full_name, u.position, u.dept, u.erg,
+               (SELECT COUNT(*) FROM user_task_registration utr WHERE utr.user_id = u.id) AS task_count,
+               u.created_at
+        FROM app_user u
+        ORDER BY u.created_at, u.id
+    """,
+}
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_BATCH_ROWS = 1000
+
+def _json_default(o):
+    if isinstance(o, datetime):
+        return o.isoformat()
+    if isinstance(o, Decimal):
+        return float(o)
+    return str(o)
+
+def _csv_value(v):
+    if v is None:
+        return ""
+    if isinstance(v, list):
+        return ";".join(str(x) for x in v)
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+def _stream_export(sql, fmt):
+    """Yield the export in chunks from a server-side cursor.
+
+    Rows are pulled EXPORT_BATCH_ROWS at a time (stream_results/yield_per),
+    so worker memory stays flat no matter how large the table is.
+    """
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=EXPORT_BATCH_ROWS).execute(text(sql))
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(result.keys())
+            for partition in result.partitions():
+                for row in partition:
+                    writer.writerow([_csv_value(v) for v in row])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate(0)
+            yield buf.getvalue()
+        else:
+            for partition in result.mappings().partitions():
+                yield "".join(json.dumps(dict(r), default=_json_default) + "\n" for r in partition)
+
+@app.get("/api/admin/export/<kind>")
+@jwt_required()
+def export_rows(kind):
+    """Stream a full table export. kind: events | tasks | registrations | users.
+    Query param: format=ndjson (default) | csv
+    """
+    fmt = (request.args.get("format") or "ndjson").lower()
+    if kind not in EXPORT_QUERIES:
+        return jsonify({"error": f"kind must be one of {sorted(EXPORT_QUERIES)}"}), 404
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {sorted(EXPORT_FORMATS)}"}), 400
+    ext = "csv" if fmt == "csv" else "ndjson"
+    return Response(
+        _stream_export(EXPORT_QUERIES[kind], fmt),
+        mimetype=EXPORT_FORMATS[fmt],
+        headers={"Content-Disposition": f"attachment; filename={kind}.{ext}"},
+    )
+
+# -------------------------
+# Admin: batched user purge
+# -------------------------
+# Whitelisted filters -> predicate on app_user u; combined with AND
+USER_PURGE_FILTERS: dict[str, str] = {
+    "ids": "u.id = ANY(CAST(:ids AS uuid[]))",
+    "unregistered": "NOT EXISTS (SELECT 1 FROM user_task_registration r WHERE r.user_id = u.id)",
+    "email_like": "u.email LIKE :email_like",
+    "created_before": "u.created_at < :created_before",
+}
+MAX_PURGE_BATCH_SIZE = 5000
+
+def purge_users(filters, batch_size=1000, max_batches=10, cursor=None, skip_locked=True):
+    """Delete users matching `filters` in keyset-ordered batches of `batch_size`.
+
+    Each batch is one transaction: a statement locks the next slice of users
+    (SKIP LOCKED unless skip_locked=False), deletes their registrations with
+    DELETE ... RETURNING, gives the removed seats back the way unregister
+    does (grouped UPDATEs for capped tasks/sessions, delta rows for uncapped
+    tasks), then deletes the users. The freed seats are then offered to the
+    waitlists and the changes logged. Locks are held for one batch only.
+    Returns (deleted users, registrations removed, next_cursor); next_cursor
+    is None once nothing is left.
+    """
+    where, params = [], {"batch": batch_size}
+    for name, value in filters.items():
+        if name not in USER_PURGE_FILTERS:
+            raise ValueError(f"unknown filter: {name}")
+        if name == "unregistered":
+            if not value:
+                continue
+        elif name == "ids":
+            params["ids"] = _parse_uuid_list(value if isinstance(value, list) else [value], MAX_PURGE_BATCH_SIZE)
+        elif name == "created_before":
+            params[name] = _parse_ts(value)
+        else:
+            params[name] = value
+        where.append(USER_PURGE_FILTERS[name])
+    if not where:
+        raise ValueError("at least one filter is required")
+    # Keyset walk, so rows skipped as locked (or kept) are never rescanned
+    where.append("(u.created_at, u.id) > (:cursor_ts, CAST(:cursor_id AS uuid))")
+    cursor = cursor or (datetime.min.replace(tzinfo=timezone.utc), str(uuid.UUID(int=0)))
+
+    lock = "FOR UPDATE SKIP LOCKED" if skip_locked else "FOR UPDATE"
+
+    sql = text(f"""
+        WITH victims AS (
+          SELECT u.id, u.created_at
+          FROM app_user u
+          WHERE {" AND ".join(where)}
+          ORDER BY u.created_at, u.id
+          LIMIT :batch
+          {lock}
+        ), regs AS (
+          DELETE FROM user_task_registration r
+          USING victims v
+          WHERE r.user_id = v.id
+          RETURNING r.task_id
+        ), per_task AS (
+          SELECT r.task_id, et.capacity, COUNT(*) AS n
+          FROM regs r JOIN event_task et ON et.id = r.task_id
+          GROUP BY r.task_id, et.capacity
+        ), fix_tasks AS (
+          UPDATE event_task et
+          SET registered_count = GREATEST(COALESCE(et.registered_count,0) - p.n, 0), updated_at=now()
+          FROM per_task p
+          WHERE et.id = p.task_id AND p.capacity IS NOT NULL
+        ), task_deltas AS (
+          INSERT INTO event_task_count_delta (task_id, delta)
+          SELECT task_id, -n FROM per_task WHERE capacity IS NULL
+        ), fix_sessions AS (
+          UPDATE event_session s
+          SET registered_count = GREATEST(s.registered_count - g.n, 0)
+          FROM (
+            SELECT et.session_id, SUM(p.n) AS n
+            FROM per_task p JOIN event_task et ON et.id = p.task_id
+            WHERE et.session_id IS NOT NULL
+            GROUP BY et.session_id
+          ) g
+          WHERE s.id = g.session_id AND s.capacity IS NOT NULL
+        ), gone AS (
+          DELETE FROM app_user u
+          USING victims v
+          WHERE u.id = v.id
+          RETURNING u.id, u.email, u.full_name
+        )
+        SELECT
+          (SELECT json_agg(json_build_object('id', id, 'email', email, 'full_name', full_name)) FROM gone) AS users,
+          (SELECT COUNT(*) FROM regs) AS registrations,
+          (SELECT json_object_agg(task_id, n) FROM per_task) AS tasks,
+          (SELECT created_at FROM victims ORDER BY created_at DESC, id DESC LIMIT 1) AS last_ts,
+          (SELECT id FROM victims ORDER BY created_at DESC, id DESC LIMIT 1) AS last_id
+    """)
+
+    deleted, registrations = [], 0
+    for _ in range(max_batches):
+        params["cursor_ts"], params["cursor_id"] = cursor
+        promoted = []
+        with SessionLocal() as db:
+            res = db.execute(sql, params).mappings().first()
+            freed = res["tasks"] or {}
+            if freed:
+                by_delta = defaultdict(list)
+                for tid, n in freed.items():
+                    by_delta[n].append(tid)
+                for n, tids in by_delta.items():
+                    log_change(db, "unregistered", tids, None, {"registered_delta": -n})
+                promoted = _promote_waitlist(db, list(freed))
+            db.commit()
+        batch = res["users"] or []
+        deleted.extend(batch)
+        registrations += res["registrations"]
+        if batch:
+            invalidate_registered_sets(*[u["id"] for u in batch], *{u for _, u in promoted})
+        if res["last_id"] is None:
+            return deleted, registrations, None
+        cursor = (res["last_ts"], str(res["last_id"]))
+    return deleted, registrations, _encode_cursor(*cursor)
+
+@app.post("/api/admin/users/purge")
+@jwt_required()
+def purge_users_endpoint():
+    """Batched, resumable user purge.
+    Body: { filters: { unregistered: true, email_like: "bench_%", created_before: ts, ids: [...] },
+            batch_size: 1000 (max 5000), max_batches: 10, cursor: <next_cursor> }
+    Call again with next_cursor until it comes back null.
+    """
+    data = request.get_json(silent=True) or {}
+    filters = data.get("filters") or {}
+    if not isinstance(filters, dict):
+        return jsonify({"error": "filters must be an object"}), 400
+    try:
+        batch_size = _parse_limit(data.get("batch_size"), default=1000, maximum=MAX_PURGE_BATCH_SIZE)
+        max_batches = _parse_limit(data.get("max_batches"), default=10, maximum=1000)
+        cursor = _decode_cursor(data["cursor"]) if data.get("cursor") else None
+        deleted, registrations, next_cursor = purge_users(filters, batch_size, max_batches, cursor)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({
+        "deleted_count": len(deleted),
+        "registrations_removed": registrations,
+        "next_cursor": next_cursor,
+    }), 200
+
 @app.delete("/api/admin/users/<uuid:user_id>")
 @jwt_required()
 def delete_user(user_id):
-    """Delete a user and all their data."""
-    with SessionLocal() as db:
-        # First check if user exists
-        user = db.execute(text("SELECT id, email FROM app_user WHERE id = :id"), {"id": user_id}).mappings().first()
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-        
-        # Delete user task registrations
-        db.execute(text("DELETE FROM user_task_registration WHERE user_id = :id"), {"id": user_id})
-        
-        # Update task registered counts
-        db.execute(text("""
-            UPDATE event_task 
-            SET registered_count = GREATEST(COALESCE(registered_count,0) - (
-                SELECT COUNT(*) FROM user_task_registration WHERE task_id = event_task.id AND user_id = :id
-            ), 0)
-            WHERE id IN (SELECT task_id FROM user_task_registration WHERE user_id = :id)
-        """), {"id": user_id})
-        
-        # Delete the user
-        db.execute(text("DELETE FROM app_user WHERE id = :id"), {"id": user_id})
-        
-        db.commit()
-        
-        return jsonify({
-            "message": f"User {user['email']} deleted successfully",
-            "deleted_user_id": str(user_id)
-        }), 200
+    """Delete a user and all their data (registration counters are fixed up first)."""
+    # Wait out a concurrent lock on the row instead of skipping it, so 404 means absent
+    deleted, _, _ = purge_users({"ids": [str(user_id)]}, batch_size=1, max_batches=1, skip_locked=False)
+    if not deleted:
+        return jsonify({"error": "User not found"}), 404
+    return jsonify({
+        "message": f"User {deleted[0]['email']} deleted successfully",
+        "deleted_user_id": str(user_id)
+    }), 200
 
 @app.post("/api/admin/delete_unregistered_users")
 @jwt_required()
 def delete_unregistered_users():
-    """Delete users who are not registered for any tasks."""
+    """Delete the oldest users who are not registered for any tasks."""
     data = request.get_json(silent=True) or {}
-    limit = data.get("limit", 40)  # Default to 40 users
-    
-    with SessionLocal() as db:
-        # Get users with no task registrations
-        unregistered_users = db.execute(text("""
-            SELECT u.id, u.email, u.full_name
-            FROM app_user u
-            LEFT JOIN user_task_registration utr ON u.id = utr.user_id
-            WHERE utr.user_id IS NULL
-            ORDER BY u.created_at ASC
-            LIMIT :limit
-        """), {"limit": limit}).mappings().all()
-        
-        if not unregistered_users:
-            return jsonify({"message": "No unregistered users found", "deleted": 0}), 200
-        
-        deleted_count = 0
-        deleted_users = []
-        
-        for user in unregistered_users:
-            try:
-                # Delete the user
-                db.execute(text("DELETE FROM app_user WHERE id = :id"), {"id": user["id"]})
-                deleted_count += 1
-                deleted_users.append({
-                    "id": str(user["id"]),
-                    "email": user["email"],
-                    "full_name": user["full_name"]
-                })
-            except Exception as e:
-                print(f"Error deleting user {user['email']}: {e}")
-                continue
-        
-        db.commit()
-        
-        return jsonify({
-            "message": f"Deleted {deleted_count} unregistered users",
-            "deleted_users": deleted_users,
-            "deleted_count": deleted_count
-        }), 200
+    try:
+        limit = _parse_limit(data.get("limit"), default=40, maximum=MAX_PURGE_BATCH_SIZE)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    deleted, _, _ = purge_users({"unregistered": True}, batch_size=limit, max_batches=1)
+    if not deleted:
+        return jsonify({"message": "No unregistered users found", "deleted": 0}), 200
+    return jsonify({
+        "message": f"Deleted {len(deleted)} unregistered users",
+        "deleted_users": deleted,
+        "deleted_count": len(deleted)
+    }), 200
 
 @app.post("/api/admin/update_task_skills")
 @jwt_required()
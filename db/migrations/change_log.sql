@@ -0,0 +1,13 @@
+-- Append-only feed of registration / task-status changes. Rows are announced
+-- on the change_feed NOTIFY channel at commit and replayed by id for SSE
+-- clients that reconnect (Last-Event-ID). No FKs: entries outlive their rows.
+CREATE TABLE IF NOT EXISTS change_log (
+  id         BIGSERIAL PRIMARY KEY,
+  kind       TEXT NOT NULL,   -- registered | unregistered | status
+  event_id   UUID,
+  task_id    UUID,
+  user_id    UUID,
+  payload    JSONB NOT NULL DEFAULT '{}',
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS idx_change_log_created ON change_log (created_at);
@@ -0,0 +1,38 @@
+-- Change watermarks (ETag validators for conditional GETs). One sequence per
+-- table family, bumped once per writing statement. Reading last_value is O(1)
+-- and, unlike MAX(updated_at), also moves on DELETE.
+CREATE SEQUENCE IF NOT EXISTS change_seq_event;
+CREATE SEQUENCE IF NOT EXISTS change_seq_event_task;
+CREATE SEQUENCE IF NOT EXISTS change_seq_registration;
+CREATE SEQUENCE IF NOT EXISTS change_seq_app_user;
+CREATE SEQUENCE IF NOT EXISTS change_seq_directory;
+
+CREATE OR REPLACE FUNCTION bump_change_seq() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM nextval(TG_ARGV[0]::regclass);
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_change_seq_event ON event;
+CREATE TRIGGER trg_change_seq_event AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON event
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_event');
+
+DROP TRIGGER IF EXISTS trg_change_seq_event_task ON event_task;
+CREATE TRIGGER trg_change_seq_event_task AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON event_task
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_event_task');
+
+DROP TRIGGER IF EXISTS trg_change_seq_registration ON user_task_registration;
+CREATE TRIGGER trg_change_seq_registration AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON user_task_registration
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_registration');
+
+DROP TRIGGER IF EXISTS trg_change_seq_app_user ON app_user;
+CREATE TRIGGER trg_change_seq_app_user AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON app_user
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_app_user');
+
+DROP TRIGGER IF EXISTS trg_change_seq_department ON department;
+CREATE TRIGGER trg_change_seq_department AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON department
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_directory');
+
+DROP TRIGGER IF EXISTS trg_change_seq_erg ON erg;
+CREATE TRIGGER trg_change_seq_erg AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON erg
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_directory');
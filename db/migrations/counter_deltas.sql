@@ -0,0 +1,110 @@
+-- Write-behind task counters: uncapped registrations append a +/-1 row here
+-- instead of updating event_task.registered_count, so concurrent registrants
+-- never wait on the task's row lock. Capped tasks still update the row, since
+-- the capacity check needs an exact count.
+CREATE TABLE IF NOT EXISTS event_task_count_delta (
+  id      BIGSERIAL PRIMARY KEY,
+  task_id UUID NOT NULL REFERENCES event_task(id) ON DELETE CASCADE,
+  delta   INT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_event_task_count_delta_task ON event_task_count_delta (task_id);
+
+-- Live value = folded base + pending deltas; call with the row, e.g. live_registered_count(et)
+CREATE OR REPLACE FUNCTION live_registered_count(t event_task) RETURNS INT AS $$
+  SELECT t.registered_count
+       + COALESCE((SELECT SUM(d.delta) FROM event_task_count_delta d WHERE d.task_id = t.id), 0)::int
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION live_registration_count(s event_stats) RETURNS INT AS $$
+  SELECT s.registration_count
+       + COALESCE((SELECT SUM(d.registration_delta) FROM event_stats_delta d WHERE d.event_id = s.event_id), 0)::int
+$$ LANGUAGE sql STABLE;
+
+CREATE OR REPLACE FUNCTION live_registrant_count(s event_stats) RETURNS INT AS $$
+  SELECT s.registrant_count
+       + COALESCE((SELECT SUM(d.registrant_delta) FROM event_stats_delta d WHERE d.event_id = s.event_id), 0)::int
+$$ LANGUAGE sql STABLE;
+
+-- Fold pending deltas into the base rows: one grouped UPDATE per table, so a
+-- hot task/event is written once per fold rather than once per registration.
+-- Empty logs are skipped so idle folds don't fire the watermark triggers.
+-- Returns the number of rows folded into; 0 if another session holds the fold.
+CREATE OR REPLACE FUNCTION fold_counter_deltas() RETURNS INT AS $$
+DECLARE
+  v_tasks INT := 0;
+  v_events INT := 0;
+  v_facts INT := 0;
+BEGIN
+  IF NOT pg_try_advisory_xact_lock(hashtext('fold_counter_deltas')) THEN
+    RETURN 0;
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM event_task_count_delta) THEN
+    WITH d AS (
+      DELETE FROM event_task_count_delta RETURNING task_id, delta
+    ), agg AS (
+      SELECT task_id, SUM(delta) AS n FROM d GROUP BY task_id
+    )
+    UPDATE event_task et
+    SET registered_count = GREATEST(et.registered_count + agg.n, 0)
+    FROM agg
+    WHERE et.id = agg.task_id AND agg.n <> 0;
+    GET DIAGNOSTICS v_tasks = ROW_COUNT;
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM event_stats_delta) THEN
+    WITH d AS (
+      DELETE FROM event_stats_delta
+      RETURNING event_id, registration_delta, registrant_delta, trending_delta, trending_epoch
+    ), agg AS (
+      -- deltas weighted before a rebase are rescaled to the current epoch
+      SELECT d.event_id, SUM(d.registration_delta) AS r, SUM(d.registrant_delta) AS u,
+             SUM(d.trending_delta * trending_weight(COALESCE(d.trending_epoch, e.epoch), e.epoch)) AS tr
+      FROM d, trending_epoch e GROUP BY d.event_id
+    )
+    UPDATE event_stats s
+    SET registration_count = GREATEST(s.registration_count + agg.r, 0),
+        registrant_count = GREATEST(s.registrant_count + agg.u, 0),
+        trending_score = GREATEST(s.trending_score + agg.tr, 0),
+        updated_at = now()
+    FROM agg
+    WHERE s.event_id = agg.event_id;
+    GET DIAGNOSTICS v_events = ROW_COUNT;
+  END IF;
+
+  IF EXISTS (SELECT 1 FROM registration_daily_delta) THEN
+    -- registration_daily (see registration facts below)
+    WITH d AS (
+      DELETE FROM registration_daily_delta
+      RETURNING day, department_id, erg_id, event_id, skill, registrations, minutes
+    ), agg AS (
+      SELECT day, department_id, erg_id, event_id, skill,
+             SUM(registrations) AS r, SUM(minutes) AS m
+      FROM d GROUP BY day, department_id, erg_id, event_id, skill
+    ), lb AS (
+      -- department / ERG leaderboards move with the all-skills rows
+      UPDATE leaderboard_score t
+      SET score = t.score + x.r
+      FROM (
+        SELECT k.kind, k.entity_id, SUM(k.r) AS r
+        FROM agg
+        CROSS JOIN LATERAL (VALUES ('department', agg.department_id, agg.r), ('erg', agg.erg_id, agg.r)) k(kind, entity_id, r)
+        WHERE agg.skill = '' AND k.entity_id <> 0
+        GROUP BY k.kind, k.entity_id
+      ) x
+      WHERE t.kind = x.kind AND t.entity_id = x.entity_id AND x.r <> 0
+    )
+    INSERT INTO registration_daily AS t (day, department_id, erg_id, event_id, skill, registrations, minutes)
+    SELECT day, department_id, erg_id, event_id, skill, r, m FROM agg
+    WHERE r <> 0 OR m <> 0
+    ON CONFLICT (day, department_id, erg_id, event_id, skill) DO UPDATE SET
+      registrations = t.registrations + EXCLUDED.registrations,
+      minutes = t.minutes + EXCLUDED.minutes;
+    GET DIAGNOSTICS v_facts = ROW_COUNT;
+  END IF;
+
+  -- Keep trending weights far from overflow (see trending_weight())
+  PERFORM rebase_trending_epoch(interval '28 days');
+
+  RETURN v_tasks + v_events + v_facts;
+END; $$ LANGUAGE plpgsql;
@@ -0,0 +1,14 @@
+-- Keyset pagination (created_at, id), list filters and facets for /api/events,
+-- plus the keyset walk of the admin user purge
+CREATE INDEX IF NOT EXISTS idx_event_created_id ON event (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_app_user_created_id ON app_user (created_at, id);
+CREATE INDEX IF NOT EXISTS idx_event_mode ON event (mode);
+CREATE INDEX IF NOT EXISTS idx_event_city_state ON event (lower(location_city), upper(location_state));
+CREATE INDEX IF NOT EXISTS idx_event_task_event_start ON event_task (event_id, start_ts);
+-- claim-next candidates: open, unassigned tasks
+CREATE INDEX IF NOT EXISTS idx_event_task_claimable ON event_task (event_id, created_at)
+  WHERE status = 'open' AND assigned_to IS NULL;
+-- Bounding-box prefilter for /api/events/nearby (exact haversine check runs after)
+CREATE INDEX IF NOT EXISTS idx_event_lat_lng ON event (location_lat, location_lng)
+  WHERE location_lat IS NOT NULL AND location_lng IS NOT NULL;
+CREATE INDEX IF NOT EXISTS idx_event_access_gin ON event USING GIN (accessibility);
@@ -0,0 +1,190 @@
+-- Per-event rollup for event listings, kept current by the triggers below
+CREATE INDEX IF NOT EXISTS idx_utr_task ON user_task_registration(task_id);
+
+CREATE TABLE IF NOT EXISTS event_stats (
+  event_id           UUID PRIMARY KEY REFERENCES event(id) ON DELETE CASCADE,
+  task_count         INT NOT NULL DEFAULT 0,
+  registration_count INT NOT NULL DEFAULT 0,   -- registrations across all tasks
+  registrant_count   INT NOT NULL DEFAULT 0,   -- distinct registered users
+  start_ts           TIMESTAMPTZ,              -- MIN(event_task.start_ts)
+  end_ts             TIMESTAMPTZ,              -- MAX(event_task.end_ts)
+  skills             TEXT[] NOT NULL DEFAULT '{}',
+  -- SUM(trending_weight(registered_at)); see trending_weight()
+  trending_score     DOUBLE PRECISION NOT NULL DEFAULT 0,
+  updated_at         TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+ALTER TABLE event_stats ADD COLUMN IF NOT EXISTS trending_score DOUBLE PRECISION NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_event_stats_start ON event_stats (start_ts);
+CREATE INDEX IF NOT EXISTS idx_event_stats_end   ON event_stats (end_ts);
+CREATE INDEX IF NOT EXISTS idx_event_stats_trending ON event_stats (trending_score DESC, event_id);
+
+-- Append-only registration deltas, folded into event_stats by fold_counter_deltas().
+-- Registrations insert here instead of updating the (hot) per-event row.
+CREATE TABLE IF NOT EXISTS event_stats_delta (
+  id                 BIGSERIAL PRIMARY KEY,
+  event_id           UUID NOT NULL,
+  registration_delta INT NOT NULL,
+  registrant_delta   INT NOT NULL,
+  trending_delta     DOUBLE PRECISION NOT NULL,
+  trending_epoch     TIMESTAMPTZ              -- epoch trending_delta was weighted against
+);
+ALTER TABLE event_stats_delta ADD COLUMN IF NOT EXISTS trending_epoch TIMESTAMPTZ;
+CREATE INDEX IF NOT EXISTS idx_event_stats_delta_event ON event_stats_delta (event_id);
+
+-- Anchor of the trending weights (single row), moved forward by rebase_trending_epoch()
+CREATE TABLE IF NOT EXISTS trending_epoch (
+  id    BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+  epoch TIMESTAMPTZ NOT NULL
+);
+INSERT INTO trending_epoch (epoch) VALUES (TIMESTAMPTZ '2025-01-01 00:00:00+00') ON CONFLICT DO NOTHING;
+
+-- Forward-decayed trending weight: exp((ts - epoch) / tau) with a 7-day
+-- half-life (tau = 7d / ln 2). Every event's score decays by the same factor,
+-- so ranking by the undecayed sum equals ranking by the decayed score and a
+-- registration only ever adds its own weight. The decayed value "as of now"
+-- is trending_score / trending_weight(now()). A double overflows ~19 years
+-- past the epoch, so rebase_trending_epoch() keeps the epoch recent.
+CREATE OR REPLACE FUNCTION trending_weight(ts TIMESTAMPTZ, p_epoch TIMESTAMPTZ) RETURNS DOUBLE PRECISION AS $$
+  SELECT exp(extract(epoch FROM ts - p_epoch) / 872542.0)
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION trending_weight(ts TIMESTAMPTZ) RETURNS DOUBLE PRECISION AS $$
+  SELECT trending_weight(ts, (SELECT epoch FROM trending_epoch))
+$$ LANGUAGE sql STABLE;
+
+-- Move the epoch to today once it is older than p_max_age, dividing every
+-- trending_score by the weight of the shift so rankings and decayed values are
+-- unchanged. Pending deltas carry the epoch they were weighted against and are
+-- rescaled by fold_counter_deltas(), whose lock this takes; refresh_event_stats()
+-- holds the epoch row FOR SHARE so it never writes a sum from the old epoch.
+-- Returns whether the epoch moved.
+CREATE OR REPLACE FUNCTION rebase_trending_epoch(p_max_age INTERVAL) RETURNS BOOLEAN AS $$
+DECLARE
+  v_old TIMESTAMPTZ;
+  v_new TIMESTAMPTZ := date_trunc('day', now());
+BEGIN
+  SELECT epoch INTO v_old FROM trending_epoch;
+  IF now() - v_old < p_max_age THEN
+    RETURN false;
+  END IF;
+  PERFORM pg_advisory_xact_lock(hashtext('fold_counter_deltas'));
+  SELECT epoch INTO v_old FROM trending_epoch FOR UPDATE;
+  IF now() - v_old < p_max_age THEN
+    RETURN false;  -- another session just moved it
+  END IF;
+  UPDATE event_stats
+  SET trending_score = trending_score / trending_weight(v_new, v_old)
+  WHERE trending_score <> 0;
+  UPDATE trending_epoch SET epoch = v_new;
+  RETURN true;
+END; $$ LANGUAGE plpgsql;
+
+-- Full recompute for one event; used on task changes and for backfill.
+-- Pending deltas are dropped in the same statement (same snapshot) because
+-- the recount already includes the registrations they describe.
+CREATE OR REPLACE FUNCTION refresh_event_stats(p_event_id UUID) RETURNS VOID AS $$
+BEGIN
+  -- Skip events that are gone (e.g. task rows removed by an event cascade)
+  IF NOT EXISTS (SELECT 1 FROM event WHERE id = p_event_id) THEN
+    RETURN;
+  END IF;
+  PERFORM 1 FROM trending_epoch FOR SHARE;  -- see rebase_trending_epoch()
+  WITH folded AS (
+    DELETE FROM event_stats_delta WHERE event_id = p_event_id
+  )
+  INSERT INTO event_stats AS s (event_id, task_count, registration_count, registrant_count,
+                                start_ts, end_ts, skills, trending_score, updated_at)
+  SELECT p_event_id,
+         (SELECT COUNT(*) FROM event_task et WHERE et.event_id = p_event_id),
+         (SELECT COUNT(*) FROM user_task_registration utr
+            JOIN event_task et ON et.id = utr.task_id WHERE et.event_id = p_event_id),
+         (SELECT COUNT(DISTINCT utr.user_id) FROM user_task_registration utr
+            JOIN event_task et ON et.id = utr.task_id WHERE et.event_id = p_event_id),
+         (SELECT MIN(start_ts) FROM event_task et WHERE et.event_id = p_event_id),
+         (SELECT MAX(end_ts) FROM event_task et WHERE et.event_id = p_event_id),
+         ARRAY(SELECT DISTINCT sk FROM event_task et, unnest(et.skills_required) AS sk
+               WHERE et.event_id = p_event_id AND sk IS NOT NULL),
+         COALESCE((SELECT SUM(trending_weight(utr.registered_at)) FROM user_task_registration utr
+                     JOIN event_task et ON et.id = utr.task_id WHERE et.event_id = p_event_id), 0),
+         now()
+  ON CONFLICT (event_id) DO UPDATE SET
+    task_count = EXCLUDED.task_count,
+    registration_count = EXCLUDED.registration_count,
+    registrant_count = EXCLUDED.registrant_count,
+    start_ts = EXCLUDED.start_ts,
+    end_ts = EXCLUDED.end_ts,
+    skills = EXCLUDED.skills,
+    trending_score = EXCLUDED.trending_score,
+    updated_at = now();
+END; $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION event_stats_on_event() RETURNS TRIGGER AS $$
+BEGIN
+  INSERT INTO event_stats (event_id) VALUES (NEW.id) ON CONFLICT DO NOTHING;
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION event_stats_on_task() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM refresh_event_stats(NEW.event_id);
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM refresh_event_stats(OLD.event_id);
+  ELSE
+    PERFORM refresh_event_stats(OLD.event_id);
+    IF NEW.event_id <> OLD.event_id THEN
+      PERFORM refresh_event_stats(NEW.event_id);
+    END IF;
+  END IF;
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+-- Registrations only move the counters, so log a delta instead of a recompute
+-- (or an UPDATE, which would serialize every registrant on the event's row).
+CREATE OR REPLACE FUNCTION event_stats_on_registration() RETURNS TRIGGER AS $$
+DECLARE
+  v_row user_task_registration;
+  v_event UUID;
+  v_sign INT;
+  v_first INT := 0;
+BEGIN
+  IF TG_OP = 'INSERT' THEN v_row := NEW; v_sign := 1; ELSE v_row := OLD; v_sign := -1; END IF;
+  SELECT event_id INTO v_event FROM event_task WHERE id = v_row.task_id;
+  IF v_event IS NULL THEN
+    RETURN NULL;  -- task already deleted; event_stats_on_task recomputes
+  END IF;
+  -- Did this row add/remove the user's only registration for the event?
+  IF NOT EXISTS (
+    SELECT 1 FROM user_task_registration utr
+    JOIN event_task et ON et.id = utr.task_id
+    WHERE utr.user_id = v_row.user_id AND et.event_id = v_event AND utr.task_id <> v_row.task_id
+  ) THEN
+    v_first := 1;
+  END IF;
+  INSERT INTO event_stats_delta (event_id, registration_delta, registrant_delta, trending_delta, trending_epoch)
+  SELECT v_event, v_sign, v_sign * v_first, v_sign * trending_weight(v_row.registered_at, e.epoch), e.epoch
+  FROM trending_epoch e;
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_event_stats_event ON event;
+CREATE TRIGGER trg_event_stats_event AFTER INSERT ON event
+FOR EACH ROW EXECUTE FUNCTION event_stats_on_event();
+
+-- registered_count bumps don't touch the rollup, so only fire on relevant columns
+DROP TRIGGER IF EXISTS trg_event_stats_task ON event_task;
+CREATE TRIGGER trg_event_stats_task
+AFTER INSERT OR DELETE OR UPDATE OF event_id, start_ts, end_ts, skills_required ON event_task
+FOR EACH ROW EXECUTE FUNCTION event_stats_on_task();
+
+DROP TRIGGER IF EXISTS trg_event_stats_registration ON user_task_registration;
+CREATE TRIGGER trg_event_stats_registration AFTER INSERT OR DELETE ON user_task_registration
+FOR EACH ROW EXECUTE FUNCTION event_stats_on_registration();
+
+-- Re-anchor at startup too, in case the periodic fold isn't running
+SELECT rebase_trending_epoch(interval '28 days');
+
+-- Backfill events created before the rollup existed
+SELECT refresh_event_stats(e.id) FROM event e
+WHERE NOT EXISTS (SELECT 1 FROM event_stats s WHERE s.event_id = e.id);
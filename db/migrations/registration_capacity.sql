@@ -0,0 +1,95 @@
+-- Task/session capacity and the FIFO task waitlist
+ALTER TABLE event_session ADD COLUMN IF NOT EXISTS registered_count INT NOT NULL DEFAULT 0;
+ALTER TABLE event_task ADD COLUMN IF NOT EXISTS capacity INT CHECK (capacity IS NULL OR capacity >= 0);
+ALTER TABLE event_task ADD COLUMN IF NOT EXISTS session_id UUID REFERENCES event_session(id) ON DELETE SET NULL;
+CREATE INDEX IF NOT EXISTS idx_event_task_session ON event_task(session_id);
+
+-- FIFO waitlist for full tasks; the head is found via (task_id, id)
+CREATE TABLE IF NOT EXISTS task_waitlist (
+  id         BIGSERIAL PRIMARY KEY,
+  task_id    UUID NOT NULL REFERENCES event_task(id) ON DELETE CASCADE,
+  user_id    UUID NOT NULL REFERENCES app_user(id) ON DELETE CASCADE,
+  created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  UNIQUE (task_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS idx_task_waitlist_head ON task_waitlist(task_id, id);
+
+-- Hand free seats to waitlisted users. Tasks in scope are p_tasks and every task
+-- sharing a session with one of them, so a seat freed on one task also reaches
+-- users queued because the session was full. Per task, only the head is taken
+-- (idx_task_waitlist_head, LIMIT 1 FOR UPDATE SKIP LOCKED) and seated with the
+-- same conditional UPDATEs as a registration (session row, then task row); the
+-- task is left as soon as it or its session has no seat, so each call locks at
+-- most one waiter per task beyond those it promotes.
+-- Returns the (task, user) pairs that were registered.
+CREATE OR REPLACE FUNCTION promote_waitlist(p_tasks UUID[])
+RETURNS TABLE (promoted_task_id UUID, promoted_user_id UUID) AS $$
+DECLARE
+  t RECORD;
+  w RECORD;
+  v_full_sessions UUID[] := '{}';
+BEGIN
+  FOR t IN
+    SELECT et.id, et.capacity, et.session_id, es.capacity AS session_capacity
+    FROM event_task et
+    LEFT JOIN event_session es ON es.id = et.session_id
+    WHERE et.id = ANY(p_tasks)
+    UNION
+    SELECT et.id, et.capacity, et.session_id, es.capacity
+    FROM event_session es
+    JOIN event_task et ON et.session_id = es.id
+    WHERE es.id IN (SELECT x.session_id FROM event_task x WHERE x.id = ANY(p_tasks))
+    ORDER BY 1
+  LOOP
+    CONTINUE WHEN t.session_id = ANY(v_full_sessions);
+    LOOP
+      SELECT q.id, q.user_id INTO w
+      FROM task_waitlist q
+      WHERE q.task_id = t.id
+      ORDER BY q.id
+      LIMIT 1
+      FOR UPDATE SKIP LOCKED;
+      EXIT WHEN NOT FOUND;
+
+      IF t.session_capacity IS NOT NULL THEN
+        UPDATE event_session s SET registered_count = s.registered_count + 1
+        WHERE s.id = t.session_id AND s.registered_count < s.capacity;
+        IF NOT FOUND THEN
+          v_full_sessions := v_full_sessions || t.session_id;
+          EXIT;
+        END IF;
+      END IF;
+      IF t.capacity IS NOT NULL THEN
+        UPDATE event_task et SET registered_count = COALESCE(et.registered_count,0) + 1, updated_at = now()
+        WHERE et.id = t.id AND COALESCE(et.registered_count,0) < et.capacity;
+        IF NOT FOUND THEN
+          IF t.session_capacity IS NOT NULL THEN
+            UPDATE event_session s SET registered_count = GREATEST(s.registered_count - 1, 0) WHERE s.id = t.session_id;
+          END IF;
+          EXIT;
+        END IF;
+      END IF;
+
+      DELETE FROM task_waitlist q WHERE q.id = w.id;
+      INSERT INTO user_task_registration (user_id, task_id) VALUES (w.user_id, t.id)
+      ON CONFLICT DO NOTHING;
+      IF NOT FOUND THEN
+        -- stale entry for a user who is already registered: drop it, give the seat back
+        IF t.capacity IS NOT NULL THEN
+          UPDATE event_task et SET registered_count = GREATEST(COALESCE(et.registered_count,0) - 1, 0) WHERE et.id = t.id;
+        END IF;
+        IF t.session_capacity IS NOT NULL THEN
+          UPDATE event_session s SET registered_count = GREATEST(s.registered_count - 1, 0) WHERE s.id = t.session_id;
+        END IF;
+        CONTINUE;
+      END IF;
+      IF t.capacity IS NULL THEN
+        INSERT INTO event_task_count_delta (task_id, delta) VALUES (t.id, 1);
+      END IF;
+
+      promoted_task_id := t.id;
+      promoted_user_id := w.user_id;
+      RETURN NEXT;
+    END LOOP;
+  END LOOP;
+END; $$ LANGUAGE plpgsql;
@@ -0,0 +1,238 @@
+-- Daily registration facts for the company analytics. One row per
+-- (UTC day, department, ERG, event, skill); skill = '' is the all-skills total,
+-- so every registration counts once there and once per required skill.
+-- department_id / erg_id use 0 for "none" so they can sit in the key.
+CREATE TABLE IF NOT EXISTS registration_daily (
+  day           DATE NOT NULL,
+  department_id INT NOT NULL,
+  erg_id        INT NOT NULL,
+  event_id      UUID NOT NULL,
+  skill         TEXT NOT NULL,
+  registrations INT NOT NULL DEFAULT 0,
+  minutes       BIGINT NOT NULL DEFAULT 0,   -- SUM(event_task.estimated_duration_min)
+  PRIMARY KEY (day, department_id, erg_id, event_id, skill)
+);
+CREATE INDEX IF NOT EXISTS idx_registration_daily_skill_day ON registration_daily (skill, day);
+
+-- Written by triggers, folded into registration_daily by fold_counter_deltas()
+CREATE TABLE IF NOT EXISTS registration_daily_delta (
+  id            BIGSERIAL PRIMARY KEY,
+  day           DATE NOT NULL,
+  department_id INT NOT NULL,
+  erg_id        INT NOT NULL,
+  event_id      UUID NOT NULL,
+  skill         TEXT NOT NULL,
+  registrations INT NOT NULL,
+  minutes       INT NOT NULL
+);
+
+-- What each live registration contributed, so it can be taken back exactly
+-- even after its user or task is gone (no FKs on purpose).
+CREATE TABLE IF NOT EXISTS registration_fact (
+  user_id       UUID NOT NULL,
+  task_id       UUID NOT NULL,
+  registered_at TIMESTAMPTZ NOT NULL,
+  department_id INT NOT NULL,
+  erg_id        INT NOT NULL,
+  event_id      UUID NOT NULL,
+  minutes       INT NOT NULL,
+  skills        TEXT[] NOT NULL,
+  PRIMARY KEY (user_id, task_id)
+);
+CREATE INDEX IF NOT EXISTS idx_registration_fact_task ON registration_fact (task_id);
+
+-- Per-user totals for distinct-volunteer metrics (only touched by that user's writes)
+CREATE TABLE IF NOT EXISTS user_registration_stats (
+  user_id            UUID PRIMARY KEY REFERENCES app_user(id) ON DELETE CASCADE,
+  registrations      INT NOT NULL DEFAULT 0,
+  minutes            BIGINT NOT NULL DEFAULT 0,
+  last_registered_at TIMESTAMPTZ
+);
+CREATE INDEX IF NOT EXISTS idx_user_registration_stats_last ON user_registration_stats (last_registered_at);
+-- Volunteer leaderboard: top-N and rank are range scans on this index
+CREATE INDEX IF NOT EXISTS idx_user_registration_stats_minutes ON user_registration_stats (minutes DESC);
+
+-- Department / ERG leaderboards: registrations by current members, one row per
+-- department and ERG (zero rows included) kept up to date by fold_counter_deltas(),
+-- so top-N is an index scan and a rank is 1 + COUNT(*) of higher scores.
+CREATE TABLE IF NOT EXISTS leaderboard_score (
+  kind      TEXT NOT NULL CHECK (kind IN ('department', 'erg')),
+  entity_id INT NOT NULL,
+  score     BIGINT NOT NULL DEFAULT 0,
+  PRIMARY KEY (kind, entity_id)
+);
+CREATE INDEX IF NOT EXISTS idx_leaderboard_score_rank ON leaderboard_score (kind, score DESC);
+
+CREATE OR REPLACE FUNCTION leaderboard_score_on_directory() RETURNS TRIGGER AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO leaderboard_score (kind, entity_id) VALUES (TG_ARGV[0], NEW.id) ON CONFLICT DO NOTHING;
+  ELSE
+    DELETE FROM leaderboard_score WHERE kind = TG_ARGV[0] AND entity_id = OLD.id;
+  END IF;
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_leaderboard_score_department ON department;
+CREATE TRIGGER trg_leaderboard_score_department AFTER INSERT OR DELETE ON department
+FOR EACH ROW EXECUTE FUNCTION leaderboard_score_on_directory('department');
+
+DROP TRIGGER IF EXISTS trg_leaderboard_score_erg ON erg;
+CREATE TRIGGER trg_leaderboard_score_erg AFTER INSERT OR DELETE ON erg
+FOR EACH ROW EXECUTE FUNCTION leaderboard_score_on_directory('erg');
+
+-- Recompute from the folded registration_daily totals (pending deltas are still
+-- applied by the next fold, which this waits out).
+CREATE OR REPLACE FUNCTION rebuild_leaderboard_scores() RETURNS VOID AS $$
+BEGIN
+  PERFORM pg_advisory_xact_lock(hashtext('fold_counter_deltas'));
+  DELETE FROM leaderboard_score;
+  INSERT INTO leaderboard_score (kind, entity_id, score)
+  SELECT 'department', d.id,
+         COALESCE((SELECT SUM(r.registrations) FROM registration_daily r
+                   WHERE r.department_id = d.id AND r.skill = ''), 0)
+  FROM department d
+  UNION ALL
+  SELECT 'erg', e.id,
+         COALESCE((SELECT SUM(r.registrations) FROM registration_daily r
+                   WHERE r.erg_id = e.id AND r.skill = ''), 0)
+  FROM erg e;
+END; $$ LANGUAGE plpgsql;
+
+-- Emit +/- deltas for the facts of one user and/or one task
+CREATE OR REPLACE FUNCTION emit_registration_facts(p_user UUID, p_task UUID, p_sign INT) RETURNS VOID AS $$
+  INSERT INTO registration_daily_delta (day, department_id, erg_id, event_id, skill, registrations, minutes)
+  SELECT (f.registered_at AT TIME ZONE 'UTC')::date, f.department_id, f.erg_id, f.event_id,
+         s.skill, p_sign, p_sign * f.minutes
+  FROM registration_fact f
+  CROSS JOIN LATERAL (SELECT '' AS skill UNION SELECT unnest(f.skills)) s
+  WHERE (p_user IS NULL OR f.user_id = p_user)
+    AND (p_task IS NULL OR f.task_id = p_task)
+    AND s.skill IS NOT NULL
+$$ LANGUAGE sql;
+
+CREATE OR REPLACE FUNCTION registration_facts_on_registration() RETURNS TRIGGER AS $$
+DECLARE
+  v_minutes INT;
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    INSERT INTO registration_fact (user_id, task_id, registered_at, department_id, erg_id, event_id, minutes, skills)
+    SELECT NEW.user_id, NEW.task_id, NEW.registered_at,
+           COALESCE(u.department_id, 0), COALESCE(u.erg_id, 0), et.event_id,
+           COALESCE(et.estimated_duration_min, 0), COALESCE(et.skills_required, '{}')
+    FROM app_user u, event_task et
+    WHERE u.id = NEW.user_id AND et.id = NEW.task_id
+    ON CONFLICT DO NOTHING
+    RETURNING minutes INTO v_minutes;
+    IF FOUND THEN
+      PERFORM emit_registration_facts(NEW.user_id, NEW.task_id, 1);
+      INSERT INTO user_registration_stats AS s (user_id, registrations, minutes, last_registered_at)
+      VALUES (NEW.user_id, 1, v_minutes, NEW.registered_at)
+      ON CONFLICT (user_id) DO UPDATE SET
+        registrations = s.registrations + 1,
+        minutes = s.minutes + EXCLUDED.minutes,
+        last_registered_at = GREATEST(s.last_registered_at, EXCLUDED.last_registered_at);
+    END IF;
+  ELSE
+    PERFORM emit_registration_facts(OLD.user_id, OLD.task_id, -1);
+    DELETE FROM registration_fact WHERE user_id = OLD.user_id AND task_id = OLD.task_id
+    RETURNING minutes INTO v_minutes;
+    IF FOUND THEN
+      UPDATE user_registration_stats s
+      SET registrations = GREATEST(s.registrations - 1, 0),
+          minutes = GREATEST(s.minutes - v_minutes, 0),
+          last_registered_at = (SELECT MAX(f.registered_at) FROM registration_fact f WHERE f.user_id = OLD.user_id)
+      WHERE s.user_id = OLD.user_id;
+    END IF;
+  END IF;
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+-- Moving a user between departments/ERGs re-attributes their existing facts
+CREATE OR REPLACE FUNCTION registration_facts_on_user() RETURNS TRIGGER AS $$
+BEGIN
+  PERFORM emit_registration_facts(NEW.id, NULL, -1);
+  UPDATE registration_fact
+  SET department_id = COALESCE(NEW.department_id, 0), erg_id = COALESCE(NEW.erg_id, 0)
+  WHERE user_id = NEW.id;
+  PERFORM emit_registration_facts(NEW.id, NULL, 1);
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+-- Same when a task's event, duration or skills change
+CREATE OR REPLACE FUNCTION registration_facts_on_task() RETURNS TRIGGER AS $$
+DECLARE
+  v_delta INT := COALESCE(NEW.estimated_duration_min, 0) - COALESCE(OLD.estimated_duration_min, 0);
+BEGIN
+  PERFORM emit_registration_facts(NULL, NEW.id, -1);
+  UPDATE registration_fact
+  SET event_id = NEW.event_id,
+      minutes = COALESCE(NEW.estimated_duration_min, 0),
+      skills = COALESCE(NEW.skills_required, '{}')
+  WHERE task_id = NEW.id;
+  PERFORM emit_registration_facts(NULL, NEW.id, 1);
+  IF v_delta <> 0 THEN
+    UPDATE user_registration_stats s
+    SET minutes = GREATEST(s.minutes + v_delta, 0)
+    FROM registration_fact f
+    WHERE f.task_id = NEW.id AND s.user_id = f.user_id;
+  END IF;
+  RETURN NULL;
+END; $$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_registration_facts ON user_task_registration;
+CREATE TRIGGER trg_registration_facts AFTER INSERT OR DELETE ON user_task_registration
+FOR EACH ROW EXECUTE FUNCTION registration_facts_on_registration();
+
+DROP TRIGGER IF EXISTS trg_registration_facts_user ON app_user;
+CREATE TRIGGER trg_registration_facts_user AFTER UPDATE OF department_id, erg_id ON app_user
+FOR EACH ROW
+WHEN (OLD.department_id IS DISTINCT FROM NEW.department_id OR OLD.erg_id IS DISTINCT FROM NEW.erg_id)
+EXECUTE FUNCTION registration_facts_on_user();
+
+DROP TRIGGER IF EXISTS trg_registration_facts_task ON event_task;
+CREATE TRIGGER trg_registration_facts_task
+AFTER UPDATE OF event_id, estimated_duration_min, skills_required ON event_task
+FOR EACH ROW
+WHEN (OLD.event_id IS DISTINCT FROM NEW.event_id
+      OR OLD.estimated_duration_min IS DISTINCT FROM NEW.estimated_duration_min
+      OR OLD.skills_required IS DISTINCT FROM NEW.skills_required)
+EXECUTE FUNCTION registration_facts_on_task();
+
+-- Rollups catch up with registrations at fold time, after the registration
+-- itself bumped its watermark; bump it again so ETags cover the folded values.
+DROP TRIGGER IF EXISTS trg_change_seq_registration_daily ON registration_daily;
+CREATE TRIGGER trg_change_seq_registration_daily AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON registration_daily
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_registration');
+
+DROP TRIGGER IF EXISTS trg_change_seq_event_stats ON event_stats;
+CREATE TRIGGER trg_change_seq_event_stats AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON event_stats
+FOR EACH STATEMENT EXECUTE FUNCTION bump_change_seq('change_seq_registration');
+
+-- Full rebuild from user_task_registration; used for the initial backfill.
+-- Blocks registration writes for its duration.
+CREATE OR REPLACE FUNCTION rebuild_registration_facts() RETURNS VOID AS $$
+BEGIN
+  LOCK TABLE user_task_registration IN SHARE MODE;
+  TRUNCATE registration_fact, registration_daily, registration_daily_delta, user_registration_stats;
+  PERFORM rebuild_leaderboard_scores();
+  INSERT INTO registration_fact (user_id, task_id, registered_at, department_id, erg_id, event_id, minutes, skills)
+  SELECT utr.user_id, utr.task_id, utr.registered_at,
+         COALESCE(u.department_id, 0), COALESCE(u.erg_id, 0), et.event_id,
+         COALESCE(et.estimated_duration_min, 0), COALESCE(et.skills_required, '{}')
+  FROM user_task_registration utr
+  JOIN app_user u ON u.id = utr.user_id
+  JOIN event_task et ON et.id = utr.task_id;
+  PERFORM emit_registration_facts(NULL, NULL, 1);
+  INSERT INTO user_registration_stats (user_id, registrations, minutes, last_registered_at)
+  SELECT user_id, COUNT(*), SUM(minutes), MAX(registered_at)
+  FROM registration_fact GROUP BY user_id;
+END; $$ LANGUAGE plpgsql;
+
+-- Backfill once for databases that predate the fact tables
+SELECT rebuild_registration_facts()
+WHERE NOT EXISTS (SELECT 1 FROM registration_fact)
+  AND EXISTS (SELECT 1 FROM user_task_registration);
+
+SELECT rebuild_leaderboard_scores()
+WHERE NOT EXISTS (SELECT 1 FROM leaderboard_score);
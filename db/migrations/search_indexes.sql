@@ -0,0 +1,14 @@
+-- Full-text + trigram search (/api/search)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+ALTER TABLE event ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR GENERATED ALWAYS AS (
+  setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+  setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+ALTER TABLE event_task ADD COLUMN IF NOT EXISTS search_tsv TSVECTOR GENERATED ALWAYS AS (
+  setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+  setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+CREATE INDEX IF NOT EXISTS idx_event_search_tsv ON event USING GIN (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_event_title_trgm ON event USING GIN (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS idx_event_task_search_tsv ON event_task USING GIN (search_tsv);
+CREATE INDEX IF NOT EXISTS idx_event_task_title_trgm ON event_task USING GIN (title gin_trgm_ops);
@@ -115,6 +115,8 @@ CREATE TABLE IF NOT EXISTS event_session (
   start_ts     TIMESTAMPTZ NOT NULL,
   end_ts       TIMESTAMPTZ NOT NULL,
   capacity     INT,
+  -- registrations held against capacity (tasks linked via event_task.session_id)
+  registered_count INT NOT NULL DEFAULT 0,
   meet_url     TEXT,
   address_line TEXT
 );
@@ -141,6 +143,11 @@ CREATE TABLE IF NOT EXISTS event_task (
   priority TEXT DEFAULT 'medium' CHECK (priority IN ('low', 'medium', 'high')),
   status TEXT DEFAULT 'open' CHECK (status IN ('open', 'claimed', 'in_progress', 'completed', 'cancelled')),
   assigned_to UUID REFERENCES app_user(id) ON DELETE SET NULL,
+  start_ts TIMESTAMPTZ,
+  end_ts TIMESTAMPTZ,
+  registered_count INT NOT NULL DEFAULT 0,
+  capacity INT CHECK (capacity IS NULL OR capacity >= 0),   -- NULL = unlimited
+  session_id UUID REFERENCES event_session(id) ON DELETE SET NULL,
   created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
   updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
 );
@@ -150,6 +157,17 @@ CREATE INDEX IF NOT EXISTS idx_event_task_assigned_to ON event_task(assigned_to)
 CREATE INDEX IF NOT EXISTS idx_event_task_status ON event_task(status);
 CREATE INDEX IF NOT EXISTS idx_event_task_skills ON event_task USING GIN (skills_required);
 
+-- ===== Task registrations (user signs up for an event_task) =====
+CREATE TABLE IF NOT EXISTS user_task_registration (
+  user_id       UUID NOT NULL REFERENCES app_user(id) ON DELETE CASCADE,
+  task_id       UUID NOT NULL REFERENCES event_task(id) ON DELETE CASCADE,
+  registered_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+  PRIMARY KEY (user_id, task_id)
+);
+
+CREATE INDEX IF NOT EXISTS idx_utr_task ON user_task_registration(task_id);
+CREATE INDEX IF NOT EXISTS idx_utr_registered_at ON user_task_registration(registered_at);
+
 -- ===== Micro-Tasks (from new schema, with indices) =====
 CREATE TABLE IF NOT EXISTS task (
   id           BIGSERIAL PRIMARY KEY,
@@ -217,4 +235,17 @@ FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
 DROP TRIGGER IF EXISTS trg_task_updated_at ON task;
 CREATE TRIGGER trg_task_updated_at BEFORE UPDATE ON task
-FOR EACH ROW EXECUTE FUNCTION set_updated_at();
\ No newline at end of file
+FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- ===== Migrations =====
+-- Indexes, rollups, triggers and functions layered on the tables above. Each file
+-- is also run at startup by the matching ensure_*() helper in backend/app.py, so
+-- this is their only copy; included in the order the backend applies them.
+\ir migrations/event_list_indexes.sql
+\ir migrations/event_stats.sql
+\ir migrations/search_indexes.sql
+\ir migrations/change_watermarks.sql
+\ir migrations/registration_capacity.sql
+\ir migrations/counter_deltas.sql
+\ir migrations/registration_facts.sql
+\ir migrations/change_log.sql
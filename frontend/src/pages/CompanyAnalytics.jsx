@@ -26,27 +26,14 @@ export default function CompanyAnalytics({ user }) {
 
   const fetchCompanyData = async () => {
     try {
-      const [overviewRes, engagementRes, progressRes, leaderboardRes, trendsRes] = await Promise.all([
-        fetch(`${API_URL}/api/company/overview`, { credentials: "include" }),
-        fetch(`${API_URL}/api/company/engagement`, { credentials: "include" }),
-        fetch(`${API_URL}/api/company/progress`, { credentials: "include" }),
-        fetch(`${API_URL}/api/company/leaderboard`, { credentials: "include" }),
-        fetch(`${API_URL}/api/company/trends`, { credentials: "include" })
-      ]);
+      const res = await fetch(`${API_URL}/api/company/dashboard`, { credentials: "include" });
+      const data = await res.json();
 
-      const [overviewData, engagementData, progressData, leaderboardData, trendsData] = await Promise.all([
-        overviewRes.json(),
-        engagementRes.json(),
-        progressRes.json(),
-        leaderboardRes.json(),
-        trendsRes.json()
-      ]);
-
-      setOverview(overviewData);
-      setEngagement(engagementData);
-      setProgress(progressData);
-      setLeaderboard(leaderboardData);
-      setTrends(trendsData);
+      setOverview(data.overview);
+      setEngagement(data.engagement);
+      setProgress(data.progress);
+      setLeaderboard(data.leaderboard);
+      setTrends(data.trends);
     } catch (error) {
       console.error("Error fetching company data:", error);
     } finally {
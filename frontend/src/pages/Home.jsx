@@ -38,6 +38,27 @@ export default function Home({ user: propUser }) {
     fetchHomeData();
   }, []);
 
+  // Live counts: patch registered_count in place from the change feed instead of re-polling
+  useEffect(() => {
+    const es = new EventSource(`${API_URL}/api/changes/stream`, { withCredentials: true });
+    const onCount = (ev) => {
+      const c = JSON.parse(ev.data);
+      const delta = (c.payload && c.payload.registered_delta) || 0;
+      if (!delta) return;
+      const bumpTask = (list) => (list || []).map((t) =>
+        t.id === c.task_id ? { ...t, registered_count: (t.registered_count ?? 0) + delta } : t
+      );
+      setRecommendedTasks(bumpTask);
+      setRegisteredTasks(bumpTask);
+      setTrendingEvents((list) => (list || []).map((e) =>
+        e.id === c.event_id ? { ...e, total_registered_count: (e.total_registered_count ?? 0) + delta } : e
+      ));
+    };
+    es.addEventListener("registered", onCount);
+    es.addEventListener("unregistered", onCount);
+    return () => es.close();
+  }, []);
+
   const fetchHomeData = async () => {
     try {
       const [tasksRes, trendingRes, regRes, analyticsRes, communitiesRes] = await Promise.all([
@@ -0,0 +1,69 @@
+"""Concurrent register/unregister throughput against a running backend.
+
+Signs up N throwaway users, then each client thread loops
+POST + DELETE /api/tasks/<task_id>/register for the given duration and
+the script prints completed operations per second. On a capped task a full
+register is answered 202 (waitlisted); that is a completed operation too,
+counted in throughput and reported separately as `waitlisted`.
+
+  python scripts/bench_registration.py --task-id <uuid> --clients 32 --seconds 20
+
+Run it once per build you want to compare (e.g. before/after a change)
+against the same database and task. Bench users are named
+bench_<run>_<n>@example.com so they can be purged afterwards.
+"""
+import argparse, threading, time, uuid
+import requests
+
+def make_client(base_url, run_id, n):
+    s = requests.Session()
+    email = f"bench_{run_id}_{n}@example.com"
+    r = s.post(f"{base_url}/auth/signup", json={"email": email, "password": "bench-pass"})
+    if r.status_code not in (200, 201):
+        r = s.post(f"{base_url}/auth/login", json={"email": email, "password": "bench-pass"})
+    r.raise_for_status()
+    return s
+
+def worker(s, url, deadline, counts, waitlisted, errors, lock):
+    ok = queued = bad = 0
+    while time.monotonic() < deadline:
+        for method in (s.post, s.delete):
+            r = method(url)
+            if r.status_code == 200:
+                ok += 1
+            elif r.status_code == 202:
+                queued += 1
+            else:
+                bad += 1
+    with lock:
+        counts.append(ok + queued)
+        waitlisted.append(queued)
+        errors.append(bad)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--base-url", default="http://localhost:8080")
+    ap.add_argument("--task-id", required=True)
+    ap.add_argument("--clients", type=int, default=16)
+    ap.add_argument("--seconds", type=float, default=15)
+    args = ap.parse_args()
+
+    run_id = uuid.uuid4().hex[:8]
+    sessions = [make_client(args.base_url, run_id, i) for i in range(args.clients)]
+    url = f"{args.base_url}/api/tasks/{args.task_id}/register"
+    counts, waitlisted, errors, lock = [], [], [], threading.Lock()
+    deadline = time.monotonic() + args.seconds
+    threads = [threading.Thread(target=worker, args=(s, url, deadline, counts, waitlisted, errors, lock))
+               for s in sessions]
+    start = time.monotonic()
+    for t in threads: t.start()
+    for t in threads: t.join()
+    elapsed = time.monotonic() - start
+
+    total = sum(counts)
+    print(f"clients={args.clients} seconds={elapsed:.1f} ops={total} waitlisted={sum(waitlisted)} "
+          f"errors={sum(errors)} "
+          f"throughput={total / elapsed:.1f} ops/s")
+
+if __name__ == "__main__":
+    main()